@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 from fastapi.responses import JSONResponse
-import json
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
+from bisect import bisect_right
 # module
-from scripts import sql_connector
+from scripts import attraction_catalog
+from scripts.cursor import encode_cursor, decode_cursor, InvalidCursor
+from scripts.json_response import RawJSONResponse, dumps, join_array
 
 router = APIRouter()
 
@@ -23,69 +25,100 @@ class Attraction(BaseModel):
 
 class AttractionListResponse(BaseModel):
     nextPage: Optional[int]
+    nextCursor: Optional[str] = None
     data: List[Attraction]
 
+class AttractionBatchInput(BaseModel):
+    ids: List[int]
+    maxImages: Optional[int] = Field(None, ge=0)
+
+class AttractionBatchResponse(BaseModel):
+    data: List[Attraction]
+    missing: List[int]
+
 class Error(BaseModel):
     error: bool
     message: str
 
 
 
+PAGE_SIZE = 8 # 每頁幾筆
+
+# after 可以是上一頁回傳的 nextCursor，也可以直接給最後一筆的景點 id
+# 回傳 {"id": 最後一筆 id} 或 {"pos": 下一筆在搜尋結果中的位置}
+def parse_after(after: str) -> dict:
+    if after.isdigit():
+        return {"id": int(after)}
+    position = decode_cursor(after)
+    if isinstance(position.get("id"), int) or isinstance(position.get("pos"), int):
+        return position
+    raise InvalidCursor("cursor 格式不正確")
+
 # 依照條件抓所有景點列表
+# 兩種分頁方式：
+#   page=N     舊的頁碼分頁，保留相容
+#   after=...  cursor 分頁，直接從上一頁最後一筆的 id 往後找，第幾頁成本都一樣
+# 有關鍵字時用搜尋索引，結果依相關程度排序，cursor 記的是結果中的位置
 @router.get("/attractions", 
             response_model=AttractionListResponse,
-            responses={500: {"model": Error}})
+            responses={400: {"model": Error}, 500: {"model": Error}})
 async def get_attractions_list(
     page: int = Query(0, ge=0), # ge=>大於或等於，le=>小於或等於
+    after: str = Query(None),
     category: str = Query(None),
-    keyword: str = Query(None)
+    keyword: str = Query(None),
+    maxImages: int = Query(None, ge=0) # 每個景點最多回傳幾張圖片，只要封面就給 1
 ):
-    offset = page * 8 # 要從List[offset]開始抓取，也就是"頁數"*"每頁有幾個"
-    parameters = [] # 放execute要用的參數
-    sql = "SELECT * FROM attractions " \
-        "WHERE 1=1 "
-    if category:
-        sql += "and category = %s "
-        parameters.append(category)
-    if keyword:
-        sql += "and (mrt = %s or name LIKE CONCAT('%', %s, '%')) "
-        parameters.append(keyword)
-        parameters.append(keyword)
-    
-    sql += "ORDER BY id LIMIT 8 OFFSET %s;"
-    parameters.append(offset)
-
-    conn = None # 宣告連線資料庫的變數
     try:
-        # 連線資料庫
-        conn = sql_connector.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql, parameters)
-            attrs = cursor.fetchall()
-        attr_list = []
-        for attr in attrs:
-            attr_list.append(
-                {
-                    "id": attr[0],
-                    "name": attr[1],
-                    "category": attr[2],
-                    "description": attr[3],
-                    "address": attr[4],
-                    "transport": attr[5],
-                    "mrt": attr[6],
-                    "lat": float(attr[7]),
-                    "lng": float(attr[8]),
-                    "images": json.loads(attr[9])
-                }
-            )
-
+        position = parse_after(after) if after else None
+    except InvalidCursor as e:
         return JSONResponse(
-            status_code=200,
+            status_code=400,
             content={
-                "nextPage": page + 1 if len(attr_list) == 8 else None,
-                "data": attr_list                
+                "error": True,
+                "message": str(e)
             }
         )
+
+    try:
+        catalog = attraction_catalog.get_catalog()
+        if keyword:
+            # 依相關程度排序的搜尋結果，再套用分類篩選
+            attr_ids = catalog.search_index.search(keyword)
+            if category:
+                attr_ids = [attr_id for attr_id in attr_ids if catalog.by_id[attr_id]["category"] == category]
+        elif category:
+            # 分類索引，已依 id 排序
+            attr_ids = catalog.by_category.get(category, [])
+        else:
+            attr_ids = catalog.ids
+
+        if position is None:
+            start = page * PAGE_SIZE # 要從List[offset]開始抓取，也就是"頁數"*"每頁有幾個"
+        elif "pos" in position:
+            start = max(position["pos"], 0)
+        elif keyword:
+            # 搜尋結果不是依 id 排序，找到那筆 id 的下一個位置
+            try:
+                start = attr_ids.index(position["id"]) + 1
+            except ValueError:
+                start = len(attr_ids)
+        else:
+            # id 列表已排序，用二分搜尋找到 id > after 的起點
+            start = bisect_right(attr_ids, position["id"])
+        # 多抓一筆，有抓到就代表還有下一頁
+        page_ids = attr_ids[start:start + PAGE_SIZE + 1]
+        has_next = len(page_ids) > PAGE_SIZE
+        page_ids = page_ids[:PAGE_SIZE]
+
+        next_page = start // PAGE_SIZE + 1 if has_next else None
+        next_cursor = encode_cursor({"pos": start + PAGE_SIZE} if keyword else {"id": page_ids[-1]}) if has_next else None
+
+        # 景點內容用載入時就轉好的 JSON 片段直接拼接
+        body = b'{"nextPage":' + dumps(next_page) + \
+            b',"nextCursor":' + dumps(next_cursor) + \
+            b',"data":' + join_array(catalog.fragment(attr_id, maxImages) for attr_id in page_ids) + b'}'
+        return RawJSONResponse(status_code=200, content=body)
     except Exception as e:
         print("取得[分頁景點列表]錯誤：", e)
         return JSONResponse(
@@ -95,112 +128,173 @@ async def get_attractions_list(
                 "message": "資料庫取得[分頁景點列表]錯誤"
             }
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
-# 抓景點資訊
-@router.get("/attraction/{attractionId}")
-async def get_attraction(attractionId: int):
-    sql = "SELECT * FROM attractions WHERE id = %s;"
-    conn = None # 宣告連線資料庫的變數
+# 找附近的景點 /api/attractions/nearby?lat=25.04&lng=121.51&radius=2000&limit=8
+# 也可以用 attractionId 當中心 (結果不含它自己)，給景點頁的「附近景點」用
+# 回傳 [{"distance": 公尺, "attraction": {...}}, ...] 由近到遠
+@router.get("/attractions/nearby",
+            responses={400: {"model": Error}, 500: {"model": Error}})
+async def get_nearby_attractions(
+    lat: float = Query(None, ge=-90, le=90),
+    lng: float = Query(None, ge=-180, le=180),
+    attractionId: int = Query(None),
+    radius: float = Query(2000, gt=0, le=50000), # 公尺
+    limit: int = Query(8, ge=1, le=50),
+    maxImages: int = Query(None, ge=0) # 每個景點最多回傳幾張圖片，只要封面就給 1
+):
     try:
-        # 連線資料庫
-        conn = sql_connector.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (attractionId, ))
-            attr_data = cursor.fetchone() # (...) 型態會是tuple
-        if attr_data:
+        catalog = attraction_catalog.get_catalog()
+        exclude = None
+        if attractionId is not None:
+            center = catalog.get(attractionId)
+            if not center:
+                return JSONResponse(
+                    status_code=400,
+                    content={
+                        "error": True,
+                        "message": "景點編號不正確"
+                    }
+                )
+            lat, lng, exclude = center["lat"], center["lng"], attractionId
+        elif lat is None or lng is None:
             return JSONResponse(
-                status_code=200,
+                status_code=400,
                 content={
-                    "data": {
-                        "id": attr_data[0],
-                        "name": attr_data[1],
-                        "category": attr_data[2],
-                        "description": attr_data[3],
-                        "address": attr_data[4],
-                        "transport": attr_data[5],
-                        "mrt": attr_data[6],
-                        "lat": float(attr_data[7]),
-                        "lng": float(attr_data[8]),
-                        "images": json.loads(attr_data[9])
-                    }
+                    "error": True,
+                    "message": "請提供經緯度 (lat, lng) 或景點編號 (attractionId)"
                 }
             )
-        else:
+        elif not catalog.geo_index.covers_lat(lat, radius):
             return JSONResponse(
                 status_code=400,
                 content={
                     "error": True,
-                    "message": "景點編號不正確"
+                    "message": "緯度超出景點資料的範圍"
                 }
             )
+
+        results = catalog.geo_index.nearby(lat, lng, radius, limit, exclude=exclude)
+        items = (
+            b'{"distance":' + dumps(round(distance)) + b',"attraction":' + catalog.fragment(attr_id, maxImages) + b'}'
+            for distance, attr_id in results
+        )
+        return RawJSONResponse(status_code=200, content=b'{"data":' + join_array(items) + b'}')
     except Exception as e:
-        print("取得[景點資訊]錯誤：", e)
+        print("取得[附近景點]錯誤：", e)
         return JSONResponse(
             status_code=500,
             content={
                 "error": True,
-                "message": "資料庫取得[景點資訊]錯誤"
+                "message": "資料庫取得[附近景點]錯誤"
             }
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
-# 抓景點類別名稱
-@router.get("/categories")
-async def get_categories():
-    sql = "SELECT category FROM attractions " \
-        "GROUP BY category ORDER BY COUNT(id) DESC;"
-    
-    conn = None # 宣告連線資料庫的變數
+MAX_BATCH_SIZE = 100 # 一次最多查幾個景點
+
+# 一次查多個景點，依傳入順序回傳 (重複的只回一次)，找不到的 id 放在 missing
+def batch_response(ids: list[int], max_images: int | None = None) -> RawJSONResponse | JSONResponse:
+    ids = list(dict.fromkeys(ids)) # 去掉重複並保留順序
+    if len(ids) > MAX_BATCH_SIZE:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "message": f"一次最多查詢 {MAX_BATCH_SIZE} 個景點"
+            }
+        )
     try:
-        # 連線資料庫
-        conn = sql_connector.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql)
-            categories = cursor.fetchall() # [(...), (...), ...] 型態會是list裡裝tuple
-            catgory_list = [cat[0] for cat in categories] # 直接去掉tuple
+        catalog = attraction_catalog.get_catalog()
+        missing = [attr_id for attr_id in ids if attr_id not in catalog.fragments]
+        body = b'{"data":' + join_array(catalog.fragment(attr_id, max_images) for attr_id in ids if attr_id in catalog.fragments) + \
+            b',"missing":' + dumps(missing) + b'}'
+        return RawJSONResponse(status_code=200, content=body)
+    except Exception as e:
+        print("取得[多筆景點資訊]錯誤：", e)
         return JSONResponse(
-            status_code=200,
+            status_code=500,
             content={
-                "data": catgory_list
+                "error": True,
+                "message": "資料庫取得[多筆景點資訊]錯誤"
+            }
+        )
+
+# 批次抓景點資訊 /api/attractions/batch?ids=1,5,9
+@router.get("/attractions/batch",
+            response_model=AttractionBatchResponse,
+            responses={400: {"model": Error}, 500: {"model": Error}})
+async def get_attractions_batch(
+    ids: str = Query(..., description="用逗號分隔的景點編號，例如 1,5,9"),
+    maxImages: int = Query(None, ge=0) # 每個景點最多回傳幾張圖片，只要封面就給 1
+):
+    try:
+        id_list = [int(attr_id) for attr_id in ids.split(",") if attr_id.strip()]
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "message": "景點編號格式不正確"
             }
         )
+    return batch_response(id_list, maxImages)
+
+# 批次抓景點資訊 (id 很多、網址放不下時用 POST)
+@router.post("/attractions/batch",
+             response_model=AttractionBatchResponse,
+             responses={400: {"model": Error}, 500: {"model": Error}})
+async def post_attractions_batch(batch: AttractionBatchInput):
+    return batch_response(batch.ids, batch.maxImages)
+
+# 抓景點資訊
+@router.get("/attraction/{attractionId}")
+async def get_attraction(attractionId: int):
+    try:
+        fragment = attraction_catalog.get_catalog().fragments.get(attractionId)
+        if fragment:
+            return RawJSONResponse(status_code=200, content=b'{"data":' + fragment + b'}')
+        else:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": True,
+                    "message": "景點編號不正確"
+                }
+            )
     except Exception as e:
-        print("取得[景點分類名稱]錯誤：", e)
+        print("取得[景點資訊]錯誤：", e)
         return JSONResponse(
             status_code=500,
             content={
                 "error": True,
-                "message": "資料庫取得[景點分類名稱]錯誤"
+                "message": "資料庫取得[景點資訊]錯誤"
             }
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
-# 抓捷運站名稱
-@router.get("/mrts")
-async def get_mrts():
-    sql = "SELECT mrt FROM attractions " \
-        "GROUP BY mrt ORDER BY COUNT(id) DESC;"
-    conn = None # 宣告連線資料庫的變數
+# 分類、捷運站列表共用：回傳載入時就算好的內容 (ETag、Cache-Control 由 HTTPCacheMiddleware 處理)
+def aggregate_response(name: str, with_count: bool) -> Response:
+    catalog = attraction_catalog.get_catalog()
+    return RawJSONResponse(status_code=200, content=catalog.aggregate_bodies[(name, with_count)])
+
+# 抓景點類別名稱 (依景點數量排序)，withCount=true 另外回傳各分類數量
+@router.get("/categories")
+async def get_categories(withCount: bool = Query(False)):
     try:
-        # 連線資料庫
-        conn = sql_connector.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql)
-            mrts = cursor.fetchall() # [(...), (...), ...] 型態會是list裡裝tuple
-            mrt_list = [mrt[0] for mrt in mrts if mrt[0] is not None] # 直接去掉tuple，並且篩選掉 null
+        return aggregate_response("categories", withCount)
+    except Exception as e:
+        print("取得[景點分類名稱]錯誤：", e)
         return JSONResponse(
-            status_code=200, 
+            status_code=500,
             content={
-                "data": mrt_list
+                "error": True,
+                "message": "資料庫取得[景點分類名稱]錯誤"
             }
         )
+
+# 抓捷運站名稱 (依景點數量排序，沒有 null)，withCount=true 另外回傳各站數量
+@router.get("/mrts")
+async def get_mrts(withCount: bool = Query(False)):
+    try:
+        return aggregate_response("mrts", withCount)
     except Exception as e:
         print("取得[捷運站名稱]錯誤：", e)
         return JSONResponse(
@@ -210,6 +304,3 @@ async def get_mrts():
                 "message": "資料庫取得[捷運站名稱]錯誤"
             }
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
\ No newline at end of file
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, Field
 from typing import Literal
 from datetime import date
-import json
+import mysql.connector
+from mysql.connector import errorcode
 # module
-from scripts import sql_connector, auth
+from scripts import sql_connector, auth, booking_cache, attraction_catalog
 
 router = APIRouter(prefix="/booking")
 
@@ -30,135 +30,120 @@ class BookingInput(BaseModel):
 
 #endregion
 
-# 抓取 request header 中的 Authorization: Bearer <token>
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/auth", auto_error=False)
+# 查資料庫組出預定行程的回應內容
+SQL_CURRENT_BOOKING = "SELECT b.booking_date AS date, b.booking_time AS time, b.price, " \
+        "a.id, a.name, a.address, a.cover_image " \
+        "FROM bookings AS b " \
+        "LEFT JOIN attractions AS a ON b.attraction_id = a.id " \
+        "WHERE b.member_id = %s AND b.status = 1;"
 
-# 取得尚未下單的預定行程
-@router.get("/", response_model=dict[str, Booking | None])
-def get_booking_data(token: str | None = Depends(oauth2_scheme)):
-    # 驗證登入
-    user_data = auth.get_user_data(token)
-    if not user_data:
-        raise HTTPException(
-            status_code=403,
-            detail="未登入系統，拒絕存取。"
-        )
-    
-    sql = "SELECT b.booking_date AS date, b.booking_time AS time, b.price, " \
-            "a.id, a.name, a.address, a.images " \
-            "FROM bookings AS b " \
-            "LEFT JOIN attractions AS a ON b.attraction_id = a.id " \
-            "WHERE b.member_id = %s AND b.status = 1;"
-    conn = None
-    try:
-        conn = sql_connector.get_connection()
+def load_booking(member_id: int) -> dict:
+    with sql_connector.connection() as conn:
         with conn.cursor(dictionary=True) as cursor:
-            cursor.execute(sql, (user_data["id"], ))
+            cursor.execute(SQL_CURRENT_BOOKING, (member_id, ))
             booking_data = cursor.fetchone()
-        if not booking_data: # 未找到任何有效預定行程
-            return {
-                "data": None
-            }
-        img_list = json.loads(booking_data["images"]) # json 先轉回 list
+    if not booking_data: # 未找到任何有效預定行程
         return {
-            "data": {
-                "attraction": {
-                    "id": booking_data["id"],
-                    "name": booking_data["name"],
-                    "address": booking_data["address"],
-                    "image": img_list[0]
-                },
-                "date": str(booking_data["date"]),
-                "time": booking_data["time"],
-                "price": booking_data["price"]
-            }
+            "data": None
+        }
+    return booking_payload(booking_data["id"], booking_data["name"], booking_data["address"],
+                           booking_data["cover_image"], booking_data["date"], booking_data["time"], booking_data["price"])
+
+def booking_payload(attraction_id, name, address, image, booking_date, booking_time, price) -> dict:
+    return {
+        "data": {
+            "attraction": {
+                "id": attraction_id,
+                "name": name,
+                "address": address,
+                "image": image or "" # 只取第一張圖，不用解整個 images JSON
+            },
+            "date": str(booking_date),
+            "time": booking_time,
+            "price": price
         }
+    }
+
+# 取得尚未下單的預定行程 (有快取就不查資料庫，見 scripts/booking_cache.py)
+@router.get("/", response_model=dict[str, Booking | None])
+def get_booking_data(user_data: dict = Depends(auth.require_user)):
+    try:
+        return booking_cache.load(user_data["id"], lambda: load_booking(user_data["id"]))
     except Exception as e:
         print("[取得預定行程]錯誤：", e)
         raise HTTPException(
             status_code=500,
             detail="資料庫系統[取得預定行程]錯誤"
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
         
+# 寫入預定：一次呼叫預存程序 replace_booking (覆蓋之前的預定中 + 新增)，再 commit，總共兩次來回
+# 直接 execute CALL，不用 cursor.callproc (它會另外送 SET 參數、SELECT 輸出參數，多兩次來回)
+SQL_REPLACE_BOOKING = "CALL replace_booking(%s, %s, %s, %s, %s);"
+# 每個會員最多一筆預定中由 uq_active_booking 保證；同一個會員同時送出兩筆時，
+# 後面那筆會撞到 1062 (或 1213 deadlock)，重試一次就會覆蓋掉前面那筆
+MAX_WRITE_ATTEMPTS = 3
+RETRY_ERRORS = (errorcode.ER_DUP_ENTRY, errorcode.ER_LOCK_DEADLOCK)
+
+def replace_booking(member_id: int, booking: BookingInput):
+    for attempt in range(MAX_WRITE_ATTEMPTS):
+        try:
+            # 萬一中途失敗，離開 with 時會 rollback，把剛才改的一半的東西撤銷
+            with sql_connector.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(SQL_REPLACE_BOOKING, (member_id, booking.attractionId, booking.date, booking.time, booking.price))
+                    conn.commit()
+                    return
+        except mysql.connector.Error as e:
+            if e.errno in RETRY_ERRORS and attempt < MAX_WRITE_ATTEMPTS - 1:
+                continue
+            if e.errno == errorcode.ER_NO_REFERENCED_ROW_2: # 景點剛好被刪掉
+                raise HTTPException(status_code=400, detail="找不到該景點")
+            raise
+
 # 建立新的預定行程
 @router.post("/")
 def create_booking_data(
         booking: BookingInput, # 沒有預設值的要放前面
-        token: str | None = Depends(oauth2_scheme)):
-    # 驗證登入
-    user_data = auth.get_user_data(token)
-    if not user_data:
-        raise HTTPException(
-            status_code=403,
-            detail="未登入系統，拒絕存取。"
-        )
-
+        user_data: dict = Depends(auth.require_user)):
     # 日期檢查
     if booking.date < date.today():
         raise HTTPException(status_code=400, detail="預約日期不能是過去的時間")
     
-    conn = None
     try:
-        conn = sql_connector.get_connection()
-        with conn.cursor(dictionary=True) as cursor:
-            # 景點id檢查
-            cursor.execute("SELECT id FROM attractions WHERE id = %s", (booking.attractionId, ))
-            if not cursor.fetchone():
-                raise HTTPException(status_code=400, detail="找不到該景點")
-            # 開始新增資料
-            # 若之前已有預定行程，先將 status 設為 0 (已覆蓋)
-            sql1 = "UPDATE bookings SET status = 0 WHERE member_id = %s AND status = 1;"
-            sql2 = "INSERT INTO bookings (member_id, attraction_id, booking_date, booking_time, price, status) " \
-                    "VALUES (%s, %s, %s, %s, %s, 1);"
-            cursor.execute(sql1, (user_data["id"], ))
-            cursor.execute(sql2, (user_data["id"], booking.attractionId, booking.date, booking.time, booking.price))
-            conn.commit()
-            return {
-                "ok": True
-            }
+        # 景點id檢查 (查記憶體的景點資料，不用打資料庫)
+        if attraction_catalog.get_catalog().get(booking.attractionId) is None:
+            raise HTTPException(status_code=400, detail="找不到該景點")
+        replace_booking(user_data["id"], booking)
+        sql_connector.mark_written(user_data["id"]) # 接下來幾秒這個會員的查詢走主資料庫
+        booking_cache.invalidate(user_data["id"])
+        return {
+            "ok": True
+        }
     except HTTPException as e: 
         raise e
     except Exception as e:
-        if conn:
-            conn.rollback() # 萬一失敗，把剛才改的一半的東西撤銷
         print("[新增預定行程]錯誤：", e)
         raise HTTPException(
             status_code=500,
             detail="資料庫系統[新增預定行程]錯誤"
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
 # 刪除目前的預定行程
 @router.delete("/")
-def delete_current_booking(token: str | None = Depends(oauth2_scheme)):
-    # 驗證登入
-    user_data = auth.get_user_data(token)
-    if not user_data:
-        raise HTTPException(
-            status_code=403,
-            detail="未登入系統，拒絕存取。"
-        )
-    
+def delete_current_booking(user_data: dict = Depends(auth.require_user)):
     # 將目前的預定行程改為已取消(status = 0)
     sql = "UPDATE bookings SET status = 0 WHERE member_id = %s AND status = 1;"
-    conn = None
     try:
-        conn = sql_connector.get_connection()
-        with conn.cursor(dictionary=True) as cursor:
-            cursor.execute(sql, (user_data["id"], ))
-            conn.commit()
-            return { "ok": True }
+        with sql_connector.connection() as conn:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute(sql, (user_data["id"], ))
+                conn.commit()
+                sql_connector.mark_written(user_data["id"])
+                booking_cache.invalidate(user_data["id"])
+                return { "ok": True }
     except Exception as e:
         print("[刪除預定行程]錯誤：", e)
         raise HTTPException(
             status_code=500,
             detail="資料庫系統[刪除預定行程]錯誤"
-        )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
\ No newline at end of file
+        )
\ No newline at end of file
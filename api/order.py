@@ -1,12 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, Path
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, HTTPException, Depends, Path, Query, Request, Response
 from pydantic import BaseModel, Field
 from typing import Literal
 from datetime import date, datetime
 import secrets
 import json
+import os
+from dotenv import load_dotenv
 # module
-from scripts import sql_connector, auth, tappay
+from scripts import sql_connector, auth, tappay, payment_worker, booking_cache, attraction_catalog
+from scripts.cursor import encode_cursor, decode_cursor, InvalidCursor
 from .booking import BookingAttraction
 
 router = APIRouter()
@@ -22,12 +24,19 @@ class Contact(BaseModel):
     email: str
     phone: str = Field(min_length=10, max_length=10)
 
+# 付款進度：PROCESSING 背景付款中、PAID 已付款、FAILED 付款失敗、UNPAID 尚未付款
+class OrderPayment(BaseModel):
+    state: Literal["PROCESSING", "PAID", "FAILED", "UNPAID"]
+    attempts: int
+    message: str | None = None
+
 class Order(BaseModel):
     number: str
     price: int
     trip: Trip
     contact: Contact
     status: Literal[0, 1]
+    payment: OrderPayment | None = None
 
 class OrderInput(BaseModel):
     price: int
@@ -45,22 +54,101 @@ class PaymentStatus(BaseModel):
 class OrderResult(BaseModel):
     number: str
     payment: PaymentStatus
+
+class OrderSummaryAttraction(BaseModel):
+    id: int | None
+    name: str | None
+    image: str | None
+
+class OrderSummaryTrip(BaseModel):
+    attraction: OrderSummaryAttraction
+    date: date | None
+    time: str | None
+
+class OrderSummary(BaseModel):
+    number: str
+    price: int
+    status: Literal[0, 1]
+    createdAt: datetime
+    trip: OrderSummaryTrip
+
+class OrderListResponse(BaseModel):
+    nextCursor: str | None
+    data: list[OrderSummary]
+
+class Error(BaseModel):
+    error: bool
+    message: str
 #endregion
 
-# 抓取 request header 中的 Authorization: Bearer <token>
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/auth", auto_error=False)
+load_dotenv()
+
+# sync：等 TapPay 付款完成才回應；async：寫入訂單跟付款工作就回應 202，由 payment_worker 在背景付款
+# 也可以每個 request 自己選：帶 Prefer: respond-async 標頭就走非同步
+CHECKOUT_MODE = os.getenv("CHECKOUT_MODE", "sync")
+PAYMENT_PENDING = -1 # 非同步下單時 payment.status 回傳這個，表示付款處理中
+
+#region 建立訂單並完成付款程序
+# 分成三段，打 TapPay 的時候不佔用任何資料庫連線 (TapPay 可能要等好幾秒，連線池很快就被佔滿)：
+#   1. reserve_order：寫入訂單 (UNPAID)、預定改成已下單，commit 後馬上還連線
+#   2. 呼叫 TapPay
+#   3. record_payment：另外借一條連線，把付款結果寫回訂單
+# 1、3 是同步的資料庫操作，丟到 db_executor 跑，不會擋住 event loop
+SQL_CURRENT_BOOKING = "SELECT id, price, attraction_id, booking_date, booking_time " \
+    "FROM bookings WHERE member_id = %s AND status = 1 FOR UPDATE;"
+SQL_INSERT_ORDER = """
+    INSERT INTO orders (order_number, booking_id, member_id, prime, 
+    contact_name, contact_email, contact_phone, price, 
+    booking_date, booking_time, attraction_id, attraction_name, status) 
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'UNPAID');
+"""
+SQL_BOOKING_ORDERED = "UPDATE bookings SET status = 2 WHERE id = %s AND status = 1;"
+SQL_ORDER_PAID = "UPDATE orders SET status = 'PAID', payment_record = %s WHERE order_number = %s;"
+SQL_ORDER_PAYMENT_FAILED = "UPDATE orders SET payment_record = %s WHERE order_number = %s;"
+
+# 第 1 段：寫入訂單，回傳要付款的金額
+# enqueue_payment=True (非同步下單) 時，付款工作跟訂單在同一個交易寫入，不會有訂單沒有工作的情況
+def reserve_order(member_id: int, order_number: str, prime: str, contact: Contact,
+                  enqueue_payment: bool = False) -> int:
+    # 萬一中途失敗，離開 with 時會 rollback
+    with sql_connector.connection() as conn, conn.cursor(dictionary=True) as cursor:
+        # 到 bookings 找對應的訂單 (鎖住這筆，同一個預定不會被重複下單)
+        cursor.execute(SQL_CURRENT_BOOKING, (member_id, ))
+        booking = cursor.fetchone()
+        if not booking:
+            raise HTTPException(status_code=400, detail="無對應的預定行程，請重新預定。")
+
+        # 紀錄這筆付款訂單到資料庫 (景點名稱從記憶體的景點資料取，存一份在訂單上給訂單列表用)
+        catalog = attraction_catalog.get_catalog_or_none()
+        attraction = (catalog.get(booking["attraction_id"]) if catalog else None) or {}
+        cursor.execute(SQL_INSERT_ORDER, (
+            order_number, booking["id"], member_id, prime, 
+            contact.name, contact.email, contact.phone, booking["price"],
+            booking["booking_date"], booking["booking_time"], booking["attraction_id"],
+            attraction.get("name")
+        ))
+        # 更新 bookings 訂單狀態為已下單
+        cursor.execute(SQL_BOOKING_ORDERED, (booking["id"], ))
+        if enqueue_payment:
+            payment_worker.enqueue(cursor, order_number)
+        conn.commit()
+    sql_connector.mark_written(member_id) # 接下來幾秒這個會員的查詢走主資料庫
+    booking_cache.invalidate(member_id) # 預定已經下單，購物車清空
+    return booking["price"]
+
+# 第 3 段：寫回付款結果 (成功改成 PAID，失敗只存紀錄)
+def record_payment(order_number: str, paid: bool, payment_record: str):
+    with sql_connector.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(SQL_ORDER_PAID if paid else SQL_ORDER_PAYMENT_FAILED, (payment_record, order_number))
+        conn.commit()
 
-# 建立訂單並完成付款程序
 @router.post("/orders", response_model=dict[str, OrderResult])
 async def create_order(
     data: OrderRequest,
-    token: str | None = Depends(oauth2_scheme)):
+    request: Request,
+    response: Response,
+    user_data: dict = Depends(auth.require_user)):
 
-    # 驗證登入
-    user_data = auth.get_user_data(token)
-    if not user_data:
-        raise HTTPException(status_code=403, detail="未登入系統，拒絕存取。")
-    
     # 取 聯絡資訊、prime
     contact = data.order.contact
     prime = data.prime
@@ -68,108 +156,179 @@ async def create_order(
     # 生成訂單編號，現在時間 yyyymmddHHMMSS; 加密隨機數字 3 bytes 十六進位表示法=六位數
     order_number = datetime.now().strftime("%Y%m%d%H%M%S") + secrets.token_hex(3)
 
-    conn = sql_connector.get_connection()
-    try:
-        with conn.cursor(dictionary=True) as cursor:
-            # 到 bookings 找對應的訂單
-            sql = "SELECT id, price FROM bookings WHERE member_id = %s AND status = 1;"
-            cursor.execute(sql, (user_data["id"], ))
-            booking = cursor.fetchone()
-
-            if not booking:
-                raise HTTPException(status_code=400, detail="無對應的預定行程，請重新預定。")
-            
-            # 紀錄這筆付款訂單到資料庫
-            sql = """
-                INSERT INTO orders (order_number, booking_id, member_id, prime, 
-                contact_name, contact_email, contact_phone, price, status) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'UNPAID');
-            """
-            cursor.execute(sql, (
-                order_number, booking["id"], user_data["id"], prime, 
-                contact.name, contact.email, contact.phone, booking["price"]
-            ))
-
-            # 更新 bookings 訂單狀態為已下單
-            sql = "UPDATE bookings SET status = 2 WHERE id = %s AND status = 1;"
-            cursor.execute(sql, (booking["id"], ))
-            conn.commit()
-
-            # 呼叫 TapPay API
-            try:
-                tappay_res = await tappay.post_tappay_api(prime, booking["price"], contact)
-            except Exception as err:
-                print(f"TapPay API 連線失敗: {err}")
-                return { 
-                    "data": OrderResult(
-                        number=order_number, 
-                        payment=PaymentStatus(
-                            status=1, 
-                            message="銀行端連線失敗"
-                        )
-                    ) 
-                }
-            
-            # 處理 tappay_res 並回傳
-            final_status = 0 if tappay_res.get("status") == 0 else tappay_res.get("status")
-            final_msg = "付款成功" if final_status == 0 else tappay_res.get("msg", "付款失敗")
-            payment_record = json.dumps(tappay_res)
-            try:
-                with conn.cursor() as cursor:
-                    if final_status == 0: # 付款成功，更新狀態為PAID
-                        sql = """
-                            UPDATE orders 
-                            SET status = 'PAID', payment_record = %s 
-                            WHERE order_number = %s;
-                        """
-                        cursor.execute(sql, (payment_record, order_number))
-                    else: # 付款失敗，把 record 存起來
-                        sql = """
-                            UPDATE orders 
-                            SET payment_record = %s 
-                            WHERE order_number = %s;
-                        """
-                        cursor.execute(sql, (payment_record, order_number))
-                    conn.commit()
-            except Exception as err:
-                print(f"更新訂單付款紀錄失敗: {err}")
-            finally:
-                # 不管有沒有存進資料庫實際上都有下訂成功了，所以都回傳200
-                return {
-                    "data": {
-                        "number": order_number,
-                        "payment": { "status": final_status, "message": final_msg }
-                    }
-                }
+    async_checkout = CHECKOUT_MODE == "async" or "respond-async" in request.headers.get("prefer", "")
 
+    try:
+        price = await sql_connector.run_in_db(reserve_order, user_data["id"], order_number, prime, contact,
+                                              enqueue_payment=async_checkout)
     except HTTPException as e: 
         raise e
     except Exception as e:
-        if conn:
-            conn.rollback() # 萬一失敗，把剛才改的一半的東西撤銷
         print("[下訂付款程序]錯誤：", e)
         raise HTTPException(
             status_code=500,
             detail="資料庫系統[下訂付款程序]錯誤"
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
+    # 非同步：付款交給背景 worker，前端用 GET /api/order/{number} 查進度
+    if async_checkout:
+        payment_worker.notify()
+        response.status_code = 202
+        return {
+            "data": {
+                "number": order_number,
+                "payment": { "status": PAYMENT_PENDING, "message": "付款處理中" }
+            }
+        }
+
+    # 呼叫 TapPay API (這時候沒有佔用資料庫連線)
+    try:
+        tappay_res = await tappay.post_tappay_api(prime, price, contact, order_number=order_number)
+    except Exception as err:
+        print(f"TapPay API 連線失敗: {err}")
+        return { 
+            "data": OrderResult(
+                number=order_number, 
+                payment=PaymentStatus(
+                    status=1, 
+                    message="銀行端連線失敗"
+                )
+            ) 
+        }
+
+    # 處理 tappay_res 並回傳
+    final_status = 0 if tappay_res.get("status") == 0 else tappay_res.get("status")
+    final_msg = "付款成功" if final_status == 0 else tappay_res.get("msg", "付款失敗")
+    try:
+        await sql_connector.run_in_db(record_payment, order_number, final_status == 0, json.dumps(tappay_res))
+    except Exception as err:
+        print(f"更新訂單付款紀錄失敗: {err}")
+    # 不管有沒有存進資料庫實際上都有下訂成功了，所以都回傳200
+    return {
+        "data": {
+            "number": order_number,
+            "payment": { "status": final_status, "message": final_msg }
+        }
+    }
+#endregion
+
+
+#region 會員的訂單列表 (由新到舊)
+# 只查 orders 一張表，條件、排序、欄位都在 idx_member_created 裡，只讀索引不用回主鍵取資料，也不用 JOIN
+# 圖片網址太長放不進索引，封面改從記憶體的景點資料取
+# cursor 分頁：記住上一頁最後一筆的 (created_at, id)，下一頁從它之後開始找，第幾頁成本都一樣
+ORDER_LIST_LIMIT = 20
+SQL_ORDER_LIST = """
+    SELECT order_number, price, status, created_at, id,
+        booking_date, booking_time, attraction_id, attraction_name
+    FROM orders
+    WHERE member_id = %s {conditions}
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s;
+"""
+ORDER_STATUS = {0: "UNPAID", 1: "PAID"}
+
+# 景點封面 (景點已經不在記憶體的景點資料裡就沒有圖)
+def cover_image(catalog, attraction_id: int | None) -> str | None:
+    attraction = catalog.get(attraction_id) if catalog and attraction_id is not None else None
+    return attraction["images"][0] if attraction and attraction["images"] else None
+
+# cursor -> (created_at, id)
+def parse_order_cursor(cursor: str) -> tuple[datetime, int]:
+    position = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(position["t"]), int(position["id"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursor("cursor 格式不正確")
+
+def list_orders(member_id: int, limit: int, status: int | None, after: tuple[datetime, int] | None) -> list[dict]:
+    conditions = []
+    parameters = [member_id]
+    if status is not None:
+        conditions.append("AND status = %s")
+        parameters.append(ORDER_STATUS[status])
+    if after is not None:
+        # 不寫成 (created_at, id) < (%s, %s)：MySQL 不會用索引的範圍掃描，會從最新的一筆一路掃過來
+        created_at, order_id = after
+        conditions.append("AND (created_at < %s OR (created_at = %s AND id < %s))")
+        parameters.extend((created_at, created_at, order_id))
+    sql = SQL_ORDER_LIST.format(conditions=" ".join(conditions))
+    with sql_connector.connection(readonly=True, member_id=member_id) as conn, conn.cursor(dictionary=True) as cursor:
+        cursor.execute(sql, (*parameters, limit))
+        return cursor.fetchall()
+
+@router.get("/orders",
+            response_model=OrderListResponse,
+            responses={400: {"model": Error}, 403: {"model": Error}, 500: {"model": Error}})
+async def get_orders(
+    after: str = Query(None), # 上一頁回傳的 nextCursor
+    status: int = Query(None, ge=0, le=1), # 0 未付款、1 已付款，不給就全部
+    limit: int = Query(ORDER_LIST_LIMIT, ge=1, le=50),
+    user_data: dict = Depends(auth.require_user)):
+
+    try:
+        position = parse_order_cursor(after) if after else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # 多抓一筆，有抓到就代表還有下一頁
+        rows = await sql_connector.run_in_db(list_orders, user_data["id"], limit + 1, status, position)
+    except Exception as e:
+        print(f"查詢訂單列表出錯: {e}")
+        raise HTTPException(status_code=500, detail="資料庫系統[取得訂單列表]錯誤")
+
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor({"t": rows[-1]["created_at"].isoformat(), "id": rows[-1]["id"]}) if has_next else None
+    catalog = attraction_catalog.get_catalog_or_none()
+    return {
+        "nextCursor": next_cursor,
+        "data": [
+            {
+                "number": row["order_number"],
+                "price": row["price"],
+                "status": 1 if row["status"] == "PAID" else 0,
+                "createdAt": row["created_at"],
+                "trip": {
+                    "attraction": {
+                        "id": row["attraction_id"],
+                        "name": row["attraction_name"],
+                        "image": cover_image(catalog, row["attraction_id"])
+                    },
+                    "date": row["booking_date"],
+                    "time": row["booking_time"]
+                }
+            }
+            for row in rows
+        ]
+    }
+#endregion
+
+# 付款進度 (非同步下單時前端輪詢用)
+def payment_progress(order: dict) -> dict:
+    if order["status"] == "PAID":
+        state = "PAID"
+    elif order["job_status"] in ("PENDING", "RUNNING", "RECONCILE"):
+        state = "PROCESSING"
+    elif order["job_status"] == "FAILED" or order["has_payment_record"]:
+        state = "FAILED"
+    else:
+        state = "UNPAID"
+    return {
+        "state": state,
+        "attempts": order["job_attempts"] or 0,
+        "message": order["job_error"]
+    }
 
 @router.get("/order/{number}", response_model=dict[str, Order | None])
 def get_order(
     number: str = Path(..., description="20位數十六進制訂單編號", pattern=r"^[0-9a-f]{20}$"),
-    token: str | None = Depends(oauth2_scheme)):
+    user_data: dict = Depends(auth.require_user)):
 
-    # 驗證登入
-    user_data = auth.get_user_data(token)
-    if not user_data:
-        raise HTTPException(status_code=403, detail="未登入系統，拒絕存取。")
-    
-    conn = sql_connector.get_connection()
     try:
-        with conn.cursor(dictionary=True) as cursor:
+        # 唯讀查詢走副本，剛下單的會員會自動改走主資料庫
+        with sql_connector.connection(readonly=True, member_id=user_data["id"]) as conn, conn.cursor(dictionary=True) as cursor:
             sql = """
                 SELECT 
                     o.order_number, 
@@ -183,10 +342,15 @@ def get_order(
                     a.id AS attraction_id, 
                     a.name AS attraction_name, 
                     a.address AS attraction_address,
-                    a.images AS attraction_images
+                    a.cover_image AS attraction_image,
+                    o.payment_record IS NOT NULL AS has_payment_record,
+                    j.status AS job_status,
+                    j.attempts AS job_attempts,
+                    j.last_error AS job_error
                 FROM orders o
                 JOIN bookings b ON o.booking_id = b.id
                 JOIN attractions a ON b.attraction_id = a.id
+                LEFT JOIN payment_jobs j ON j.order_number = o.order_number
                 WHERE o.order_number = %s AND o.member_id = %s;
             """
             cursor.execute(sql, (number, user_data["id"]))
@@ -197,9 +361,6 @@ def get_order(
             
             # PAID => 1 UNPAID => 0
             status_code = 1 if order["status"] == "PAID" else 0
-            # images json 先轉回 list
-            img_list = json.loads(order["attraction_images"]) 
-
             # 組合成要求的 JSON 格式
             result = {
                 "data": {
@@ -210,7 +371,7 @@ def get_order(
                             "id": order["attraction_id"],
                             "name": order["attraction_name"],
                             "address": order["attraction_address"],
-                            "image": img_list[0]
+                            "image": order["attraction_image"] or ""
                         },
                         "date": str(order["date"]), # 確保日期轉為字串
                         "time": order["time"]
@@ -220,7 +381,8 @@ def get_order(
                         "email": order["contact_email"],
                         "phone": order["contact_phone"]
                     },
-                    "status": status_code
+                    "status": status_code,
+                    "payment": payment_progress(order)
                 }
             }
             return result
@@ -229,8 +391,5 @@ def get_order(
     except Exception as e:
         print(f"查詢訂單出錯: {e}")
         raise HTTPException(status_code=500, detail="資料庫系統[取得付款訂單]錯誤")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
     
@@ -1,10 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import JSONResponse
-from fastapi.security import OAuth2PasswordBearer
 import json
+import mysql.connector
 from pydantic import BaseModel, Field
 # module
-from scripts import sql_connector, auth
+from scripts import sql_connector, auth, password_hasher
 
 router = APIRouter(prefix="/user")
 
@@ -32,58 +32,81 @@ class Error(BaseModel):
 #endregion
 
 #region 註冊帳戶 api/user/
+# 資料庫操作丟到 db_executor，bcrypt 丟到 password_hasher 的 process pool，都不佔用 event loop
+SQL_EMAIL_EXISTS = "SELECT email FROM members WHERE email = %s;"
+SQL_INSERT_MEMBER = "INSERT INTO members(name, email, password) VALUES(%s, %s, %s);"
+
+# 新增會員，信箱重複 (同時註冊被別人搶先) 回傳 False
+def insert_member(name: str, email: str, hashed_password: str) -> bool:
+    with sql_connector.connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute(SQL_INSERT_MEMBER, (name, email, hashed_password))
+            except mysql.connector.IntegrityError:
+                return False
+            conn.commit()
+            return True
+
 @router.post("/", 
              response_model=Success,
-             responses={400: {"model": Error}, 500: {"model": Error}})
-def sign_up(user: UserSignUpInput):
-    sql = "SELECT email FROM members WHERE email = %s;"
-    conn = None
+             responses={400: {"model": Error}, 500: {"model": Error}, 503: {"model": Error}})
+async def sign_up(user: UserSignUpInput):
+    email = user.email.lower() # 用小寫判斷
     try:
-        # 連線資料庫
-        conn = sql_connector.get_connection()
-        with conn.cursor() as cursor:
-            cursor.execute(sql, (user.email.lower(), )) # 用小寫判斷
-            email_exists = cursor.fetchone()
-
-            # 判斷信箱是否存在
-            if email_exists: # 信箱重複，不能註冊
-                raise HTTPException(
-                    status_code=400,
-                    detail="此電子郵件信箱已被註冊，請使用其他信箱。"
-                )
-            else: # 信箱沒有重複，可以註冊
-                sql = "INSERT INTO members(name, email, password) VALUES(%s, %s, %s);"
-                hashed_password = auth.get_password_hash(user.password) # hash 加密
-                cursor.execute(sql, (user.name, user.email.lower(), hashed_password))
-                conn.commit()
-                return {
-                    "ok": True
-                }
+        # 判斷信箱是否存在 (先查，重複的就不用花時間算 hash)
+        email_exists = await sql_connector.fetch_one_async(SQL_EMAIL_EXISTS, (email, ))
+        if email_exists: # 信箱重複，不能註冊
+            raise HTTPException(
+                status_code=400,
+                detail="此電子郵件信箱已被註冊，請使用其他信箱。"
+            )
+        # 信箱沒有重複，可以註冊
+        hashed_password = await password_hasher.hash_password(user.password) # hash 加密
+        if not await sql_connector.run_in_db(insert_member, user.name, email, hashed_password):
+            raise HTTPException(
+                status_code=400,
+                detail="此電子郵件信箱已被註冊，請使用其他信箱。"
+            )
+        return {
+            "ok": True
+        }
     # 攔截 HTTPException，避免導到下面的通用錯誤
     except HTTPException as e: 
         raise e
+    except password_hasher.HasherBusy as e:
+        print("[註冊會員]錯誤：", e)
+        raise HTTPException(
+            status_code=503,
+            detail="系統忙碌中，請稍後再試。",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         print("[註冊會員]錯誤：", e)
         raise HTTPException(
             status_code=500,
             detail="資料庫系統[新增會員]錯誤"
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 #endregion
 
 #region 登入帳戶 api/user/auth
-@router.put("/auth")
-def sign_in(user: UserSignInInput):
-    sql = "SELECT * FROM members WHERE email=%s;"
-    conn = None
+SQL_MEMBER_BY_EMAIL = "SELECT * FROM members WHERE email=%s;"
+SQL_UPDATE_PASSWORD = "UPDATE members SET password = %s WHERE id = %s;"
+
+# 工作係數改過的舊 hash，登入成功時換成新的 (失敗也不影響登入)
+def update_password_hash(member_id: int, hashed_password: str):
+    try:
+        with sql_connector.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(SQL_UPDATE_PASSWORD, (hashed_password, member_id))
+                conn.commit()
+    except Exception as e:
+        print("[更新密碼 hash]錯誤：", e)
+
+@router.put("/auth", responses={400: {"model": Error}, 500: {"model": Error}, 503: {"model": Error}})
+async def sign_in(user: UserSignInInput):
     try:
         # 驗證信箱
-        conn = sql_connector.get_connection()
-        with conn.cursor(dictionary=True) as cursor:
-            cursor.execute(sql, (user.email.lower(), )) # 用小寫判斷
-            user_data = cursor.fetchone()
+        user_data = await sql_connector.fetch_one_async(SQL_MEMBER_BY_EMAIL, (user.email.lower(), ), dictionary=True) # 用小寫判斷
         if not user_data: # 找不到"信箱"
             raise HTTPException(
                 status_code=400,
@@ -92,12 +115,14 @@ def sign_in(user: UserSignInInput):
         
         # 驗證密碼
         stored_hash = user_data["password"] # 資料庫存的 hash 密碼
-        is_valid = auth.verify_password(user.password, stored_hash) # 驗證密碼，相同 True ; 不同 False
+        is_valid, new_hash = await password_hasher.verify_password(user.password, stored_hash) # 相同 True ; 不同 False
         if not is_valid: # 密碼錯誤
             raise HTTPException(
                 status_code=400,
                 detail="密碼錯誤，請重新輸入。"
             )
+        if new_hash: # 工作係數改過，順便存新的 hash
+            await sql_connector.run_in_db(update_password_hash, user_data["id"], new_hash)
         
         # 製造 JWT
         token_payload = {
@@ -114,32 +139,26 @@ def sign_in(user: UserSignInInput):
     except HTTPException as e: 
         print("[登入會員]錯誤：", e)
         raise e
+    except password_hasher.HasherBusy as e:
+        print("[登入會員]錯誤：", e)
+        raise HTTPException(
+            status_code=503,
+            detail="系統忙碌中，請稍後再試。",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         print("[登入會員]錯誤：", e)
         raise HTTPException(
             status_code=500,
             detail="資料庫系統[登入會員]錯誤"
         )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 #endregion
 
-# 抓取 request header 中的 Authorization: Bearer <token>
-# tokenUrl 是給 Swagger UI 測試用的，auto_error=false 不要自動報錯，而是回傳 none
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/auth", auto_error=False)
-
 #region 取得當前會員資訊
 @router.get("/auth", response_model=dict[str, User | None])
-def get_user_info(token: str | None = Depends(oauth2_scheme)):
-    # 沒有 token (未登入)
-    if not token:
-        return {
-            "data": None
-        }
-    # 驗證 token 正確性
-    user_data = auth.get_user_data(token)
+def get_user_info(user_data: dict | None = Depends(auth.get_current_user)):
+    # 沒有 token (未登入) 或 token 錯誤都回傳 None
     return {
         "data": user_data
     }
-#endregion 
\ No newline at end of file
+#endregion
\ No newline at end of file
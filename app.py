@@ -1,8 +1,58 @@
 from fastapi import *
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse
 from api.router import router as api_router
 from fastapi.staticfiles import StaticFiles
-app=FastAPI()
+from contextlib import asynccontextmanager
+import asyncio
+from scripts import attraction_catalog, sql_connector, password_hasher, tappay, payment_worker, stats_log
+from scripts.json_response import FastJSONResponse
+from scripts.http_cache import HTTPCacheMiddleware
+from scripts.rate_limit import RateLimitMiddleware
+from scripts.idempotency import IdempotencyMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 先開好算密碼 hash 的 process (在其他 thread 開始跑之前)
+    await password_hasher.start()
+    # TapPay 共用的 HTTP client (連線保留重複使用)
+    await tappay.start()
+    # 先開好最少數量的資料庫連線，再把景點資料整包載入記憶體
+    await sql_connector.run_in_db(sql_connector.warm_up)
+    await attraction_catalog.reload()
+    # 定期檢查景點資料版本，匯入有變動就自動重新載入
+    watcher = None
+    if attraction_catalog.REFRESH_SECONDS > 0:
+        watcher = asyncio.create_task(attraction_catalog.watch())
+    # 非同步付款的背景 worker (PAYMENT_WORKER=off 表示另外用 python -m scripts.payment_worker 跑)
+    worker = None
+    if payment_worker.PAYMENT_WORKER == "inprocess":
+        worker = asyncio.create_task(payment_worker.run())
+    # 定期印出連線池等執行狀況
+    stats_logger = None
+    if stats_log.STATS_LOG_SECONDS > 0:
+        stats_logger = asyncio.create_task(stats_log.run())
+    yield
+    if stats_logger:
+        stats_logger.cancel()
+    if watcher:
+        watcher.cancel()
+    if worker:
+        # 不再領新工作，等處理中的付款做完 (還要用到 TapPay client 跟資料庫，所以要在關掉它們之前)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+    await tappay.close()
+    sql_connector.close_all()
+    password_hasher.shutdown()
+
+# 沒有特別指定回應類別的 API 都用比較快的 JSON 轉換
+app=FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# 景點相關 GET 的 ETag / 304 / Cache-Control
+app.add_middleware(HTTPCacheMiddleware)
+# 下單、預定的 Idempotency-Key (重送的請求直接回傳第一次的回應)
+app.add_middleware(IdempotencyMiddleware)
+# 登入、註冊、下單的限流 (最外層，超過就直接回 429)
+app.add_middleware(RateLimitMiddleware)
 
 # router 
 # /api
@@ -14,12 +64,13 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # 統一回傳錯誤格式
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=exc.status_code,
         content={
             "error": True,
             "message": exc.detail
-        }
+        },
+        headers=exc.headers # 例如 503 的 Retry-After
     )
 
 # Static Pages (Never Modify Code in this Block)
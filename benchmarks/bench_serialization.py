@@ -0,0 +1,87 @@
+# 景點列表回應的序列化 micro-benchmark
+# 比較「舊做法：每個 request 從資料列組 dict、json.loads 圖片、JSONResponse 重新轉 JSON」
+# 跟「新做法：載入時先轉好每個景點的 JSON 片段，回應時直接拼接」
+#
+# 用法 (在專案根目錄)：python -m benchmarks.bench_serialization
+import json
+import re
+import timeit
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+# module
+from scripts.json_response import FastJSONResponse, RawJSONResponse, dumps, join_array
+
+PAGE_SIZE = 8
+ROUNDS = 20000
+
+# 從原始資料做出跟資料庫查出來一樣格式的資料列 (tuple)
+def load_rows():
+    with open("./data/taipei-attractions.json", "r", encoding="utf-8-sig") as file:
+        attractions = json.load(file)["result"]["results"]
+    rows = []
+    for attr in attractions:
+        url_list = re.findall(r"https://.*?(?=https://|$)", attr["file"])
+        img_list = [u for u in url_list if u.endswith((".jpg", ".JPG", ".png", ".PNG"))]
+        rows.append((
+            attr["_id"], attr["name"], attr["CAT"], attr["description"], attr["address"],
+            attr["direction"], attr["MRT"], Decimal(attr["latitude"]), Decimal(attr["longitude"]),
+            json.dumps(img_list)
+        ))
+    return rows
+
+def row_to_dict(attr):
+    return {
+        "id": attr[0],
+        "name": attr[1],
+        "category": attr[2],
+        "description": attr[3],
+        "address": attr[4],
+        "transport": attr[5],
+        "mrt": attr[6],
+        "lat": float(attr[7]),
+        "lng": float(attr[8]),
+        "images": json.loads(attr[9])
+    }
+
+# 舊做法
+def page_before(rows):
+    attr_list = [row_to_dict(attr) for attr in rows]
+    return JSONResponse(status_code=200, content={"nextPage": 1, "data": attr_list}).body
+
+# 新做法
+def page_after(fragments, page_ids):
+    body = b'{"nextPage":' + dumps(1) + b',"nextCursor":' + dumps(None) + \
+        b',"data":' + join_array(fragments[attr_id] for attr_id in page_ids) + b'}'
+    return RawJSONResponse(status_code=200, content=body).body
+
+def bench(name, func):
+    seconds = min(timeit.repeat(func, number=ROUNDS, repeat=3))
+    per_call = seconds / ROUNDS * 1e6
+    print(f"{name:<40} {per_call:8.1f} us/次")
+    return per_call
+
+def main():
+    rows = load_rows()
+    page_rows = rows[:PAGE_SIZE]
+    fragments = {row[0]: dumps(row_to_dict(row)) for row in rows}
+    page_ids = [row[0] for row in page_rows]
+
+    # 先確認兩種做法內容一樣 (nextCursor 是新欄位，比對時拿掉)
+    before = json.loads(page_before(page_rows))
+    after = json.loads(page_after(fragments, page_ids))
+    after.pop("nextCursor")
+    assert before == after, "新舊回應內容不一致"
+
+    print(f"一頁 {PAGE_SIZE} 筆景點，每項跑 {ROUNDS} 次取最快")
+    old = bench("舊：組 dict + json.loads + JSONResponse", lambda: page_before(page_rows))
+    new = bench("新：拼接預先轉好的 JSON 片段", lambda: page_after(fragments, page_ids))
+    print(f"列表回應快了 {old / new:.1f} 倍")
+
+    # 其他動態回應：JSONResponse vs FastJSONResponse
+    content = {"data": [row_to_dict(row) for row in page_rows]}
+    old = bench("JSONResponse", lambda: JSONResponse(content).body)
+    new = bench("FastJSONResponse", lambda: FastJSONResponse(content).body)
+    print(f"動態回應快了 {old / new:.1f} 倍")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# API 壓力測試：啟動 app.py，用多個虛擬使用者模擬真實流量，統計每個 API 的延遲與錯誤率
+#
+# 準備：
+#   1. 本機 MySQL (可用 docker compose -f benchmarks/docker-compose.yml up -d)，.env 指到它
+#   2. 加 --seed 會在 attractions 表是空的時候用 scripts/load_attractions.py 匯入景點
+# 用法 (在專案根目錄)：
+#   python -m benchmarks.load_test --seed --concurrency 50 --duration 60
+#   python -m benchmarks.load_test --mix scroll=5,search=2,meta=2,sign_in=1 --output before.json
+#   python -m benchmarks.load_test --compare before.json --output after.json
+#   python -m benchmarks.load_test --base-url http://staging:8000   (不啟動本機 app，直接打現有的服務)
+# 付款會打 scripts/tappay_stub.py 的假 TapPay，不會連到真的 TapPay
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+import httpx
+
+DEFAULT_MIX = "scroll=5,search=2,meta=2,sign_in=1,booking=1,order=1"
+KEYWORDS = ["北投", "士林", "溫泉", "公園", "劍潭", "博物館", "101", "夜市", "老街", "步道"]
+PASSWORD = "bench-password"
+
+#region 統計
+class Recorder:
+    def __init__(self):
+        self.samples = {} # "GET /api/attractions" -> [(延遲秒數, 是否成功, 是否被限流), ...]
+
+    def add(self, endpoint: str, seconds: float, ok: bool, throttled: bool = False):
+        self.samples.setdefault(endpoint, []).append((seconds, ok, throttled))
+
+    # 發一個 request 並記錄，expected 是視為成功的狀態碼
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str,
+                      expected=(200,), **kwargs) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.add(endpoint, time.perf_counter() - start, False)
+            return None
+        # 429 是被限流擋下來的，另外算，不算成錯誤
+        self.add(endpoint, time.perf_counter() - start, response.status_code in expected, response.status_code == 429)
+        return response
+
+# 排序後取第 p 百分位 (nearest-rank)
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(samples: list[tuple[float, bool, bool]], elapsed: float) -> dict:
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    throttled = sum(1 for _, _, is_throttled in samples if is_throttled)
+    errors = sum(1 for _, ok, is_throttled in samples if not ok and not is_throttled)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throttled": throttled,
+        "throttled_rate": round(throttled / len(samples), 4) if samples else 0.0,
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0
+    }
+#endregion
+
+#region 情境 (每個虛擬使用者重複隨機挑一個來跑)
+class VirtualUser:
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: Recorder, attraction_ids: list[int]):
+        self.attraction_ids = attraction_ids
+        self.email = f"bench-user-{index}@bench.local"
+        self.client = client
+        self.recorder = recorder
+        self.token = None
+
+    def auth_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    # 註冊 (已註冊過會是 400，沒關係) 並登入，失敗就中止測試，不然後面的情境都只會一直重新登入
+    async def setup(self):
+        response = await self.client.post("/api/user/", json={"name": "bench", "email": self.email, "password": PASSWORD})
+        if response.status_code not in (200, 400):
+            raise SystemExit(f"{self.email} 註冊失敗：{response.status_code} {response.text}")
+        await self.sign_in()
+        if not self.token:
+            raise SystemExit(f"{self.email} 登入失敗，確認資料庫與 app 設定")
+
+    async def sign_in(self):
+        response = await self.recorder.request(
+            self.client, "PUT /api/user/auth", "PUT", "/api/user/auth",
+            json={"email": self.email, "password": PASSWORD}
+        )
+        if response is not None and response.status_code == 200:
+            self.token = response.json()["token"]
+
+    # 首頁：無限捲動往下滑幾頁
+    async def scroll(self):
+        url = "/api/attractions?page=0"
+        for _ in range(random.randint(1, 8)):
+            response = await self.recorder.request(self.client, "GET /api/attractions", "GET", url)
+            if response is None or response.status_code != 200:
+                return
+            next_cursor = response.json().get("nextCursor")
+            if not next_cursor:
+                return
+            url = f"/api/attractions?after={next_cursor}"
+
+    # 關鍵字搜尋，一個字一個字打
+    async def search(self):
+        keyword = random.choice(KEYWORDS)
+        for length in range(1, len(keyword) + 1):
+            await self.recorder.request(
+                self.client, "GET /api/attractions?keyword", "GET", "/api/attractions",
+                params={"keyword": keyword[:length]}
+            )
+
+    # 首頁一進來要的分類、捷運站，加上看一個景點
+    async def meta(self):
+        await self.recorder.request(self.client, "GET /api/mrts", "GET", "/api/mrts")
+        await self.recorder.request(self.client, "GET /api/categories", "GET", "/api/categories")
+        await self.recorder.request(
+            self.client, "GET /api/attraction/{id}", "GET", f"/api/attraction/{random.choice(self.attraction_ids)}"
+        )
+
+    async def booking(self):
+        if not self.token:
+            return await self.sign_in()
+        await self.recorder.request(
+            self.client, "POST /api/booking", "POST", "/api/booking/",
+            headers=self.auth_headers(), json=self.booking_payload()
+        )
+        await self.recorder.request(
+            self.client, "GET /api/booking", "GET", "/api/booking/", headers=self.auth_headers()
+        )
+
+    # 預定 + 下單付款 (假 TapPay)
+    async def order(self):
+        if not self.token:
+            return await self.sign_in()
+        booking = self.booking_payload()
+        response = await self.recorder.request(
+            self.client, "POST /api/booking", "POST", "/api/booking/",
+            headers=self.auth_headers(), json=booking
+        )
+        if response is None or response.status_code != 200:
+            return
+        order = {
+            "prime": "bench_prime",
+            "order": {
+                "price": booking["price"],
+                "trip": {
+                    "attraction": {"id": booking["attractionId"], "name": "", "address": "", "image": ""},
+                    "date": booking["date"],
+                    "time": booking["time"]
+                },
+                "contact": {"name": "bench", "email": self.email, "phone": "0912345678"}
+            }
+        }
+        response = await self.recorder.request(
+            self.client, "POST /api/orders", "POST", "/api/orders", headers=self.auth_headers(), json=order
+        )
+        if response is not None and response.status_code == 200:
+            number = response.json()["data"]["number"]
+            await self.recorder.request(
+                self.client, "GET /api/order/{number}", "GET", f"/api/order/{number}", headers=self.auth_headers()
+            )
+
+    def booking_payload(self) -> dict:
+        time_of_day = random.choice(["morning", "afternoon"])
+        return {
+            "attractionId": random.choice(self.attraction_ids),
+            "date": str(date.today() + timedelta(days=random.randint(1, 30))),
+            "time": time_of_day,
+            "price": 2000 if time_of_day == "morning" else 2500
+        }
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(VirtualUser, name.strip()):
+            raise SystemExit(f"未知的情境：{name}")
+        weights[name.strip()] = int(weight or 1)
+    return weights
+
+async def run_user(user: VirtualUser, weights: dict[str, int], deadline: float):
+    names = list(weights)
+    scenario_weights = [weights[name] for name in names]
+    while time.perf_counter() < deadline:
+        scenario = random.choices(names, weights=scenario_weights)[0]
+        await getattr(user, scenario)()
+
+# 先把所有景點 id 抓下來 (id 不是連續的)，情境裡只挑存在的景點
+async def fetch_attraction_ids(client: httpx.AsyncClient) -> list[int]:
+    ids = []
+    url = "/api/attractions?page=0"
+    while url:
+        response = await client.get(url)
+        response.raise_for_status()
+        body = response.json()
+        ids.extend(attraction["id"] for attraction in body["data"])
+        url = f"/api/attractions?after={body['nextCursor']}" if body.get("nextCursor") else None
+    if not ids:
+        raise SystemExit("沒有景點資料，先用 --seed 匯入")
+    return ids
+
+async def run_load(base_url: str, concurrency: int, duration: float, weights: dict[str, int]) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        attraction_ids = await fetch_attraction_ids(client)
+        users = [VirtualUser(i, client, recorder, attraction_ids) for i in range(concurrency)]
+        await asyncio.gather(*(user.setup() for user in users))
+        recorder.samples.clear() # 暖身 (註冊登入) 不算進結果
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_user(user, weights, start + duration) for user in users))
+        elapsed = time.perf_counter() - start
+
+    all_samples = [sample for samples in recorder.samples.values() for sample in samples]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total": summarize(all_samples, elapsed),
+        "endpoints": {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(recorder.samples.items())}
+    }
+#endregion
+
+#region 啟動本機服務
+def seed_attractions():
+    import mysql.connector
+    from dotenv import load_dotenv
+    load_dotenv()
+    conn = mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME")
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM attractions;")
+            count = cursor.fetchone()[0]
+    finally:
+        conn.close()
+    if count == 0:
+        print("匯入景點資料...")
+        subprocess.run([sys.executable, "scripts/load_attractions.py"], check=True)
+
+def start_process(args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", *args], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise SystemExit(f"服務沒有啟動：{url}")
+#endregion
+
+#region 輸出
+def print_report(result: dict, previous: dict | None):
+    header = f"{'endpoint':<32}{'req':>8}{'rps':>9}{'err%':>7}{'429%':>7}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["total"])]
+    for endpoint, stats in rows:
+        line = f"{endpoint:<32}{stats['requests']:>8}{stats['rps']:>9.1f}{stats['error_rate'] * 100:>6.1f}%" \
+               f"{stats['throttled_rate'] * 100:>6.1f}%" \
+               f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+        old = (previous or {}).get("endpoints", {}).get(endpoint) if endpoint != "TOTAL" else (previous or {}).get("total")
+        if old:
+            line += f"   p95 {delta(old['p95_ms'], stats['p95_ms'])}  rps {delta(old['rps'], stats['rps'])}"
+        print(line)
+
+def delta(old: float, new: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+#endregion
+
+def main():
+    parser = argparse.ArgumentParser(description="台北一日遊 API 壓力測試")
+    parser.add_argument("--base-url", help="直接測現有的服務，不啟動本機 app")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 數")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時幾個虛擬使用者")
+    parser.add_argument("--duration", type=float, default=30.0, help="測試秒數")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="情境權重，例如 scroll=5,search=2")
+    parser.add_argument("--seed", action="store_true", help="attractions 表是空的就先匯入")
+    parser.add_argument("--seed-random", type=int, default=None, help="固定隨機種子，讓每次流量一樣")
+    parser.add_argument("--output", default="benchmarks/results/latest.json", help="結果 JSON 存放位置")
+    parser.add_argument("--compare", help="跟之前的結果 JSON 比較")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    if args.seed_random is not None:
+        random.seed(args.seed_random)
+
+    processes = []
+    base_url = args.base_url
+    try:
+        if not base_url:
+            if args.seed:
+                seed_attractions()
+            env = dict(os.environ)
+            stub_port = args.port + 1
+            env["TAPPAY_URL"] = f"http://127.0.0.1:{stub_port}/tpc/payment/pay-by-prime"
+            env["TAPPAY_RECORD_URL"] = f"http://127.0.0.1:{stub_port}/tpc/transaction/query"
+            env.setdefault("TAPPAY_PARTNER_KEY", "stub_partner_key") # 假 TapPay 只檢查有沒有給
+            env.setdefault("TAPPAY_MERCHANT_ID", "stub_merchant")
+            # 虛擬使用者都從 127.0.0.1 來，開著限流的話大部分登入、下單都會被 429 擋掉
+            # 要連限流一起測就自己設 RATE_LIMIT_ENABLED=1 (429 會另外統計)
+            env.setdefault("RATE_LIMIT_ENABLED", "0")
+            processes.append(start_process(["scripts.tappay_stub:app", "--port", str(stub_port)], env))
+            processes.append(start_process(["app:app", "--port", str(args.port), "--workers", str(args.workers)], env))
+            base_url = f"http://127.0.0.1:{args.port}"
+            wait_ready(f"http://127.0.0.1:{stub_port}/docs")
+        wait_ready(f"{base_url}/api/categories")
+
+        print(f"{base_url}  concurrency={args.concurrency}  duration={args.duration}s  mix={args.mix}")
+        result = asyncio.run(run_load(base_url, args.concurrency, args.duration, weights))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    result["meta"] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "base_url": base_url,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "mix": weights
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            previous = json.load(file)
+    print_report(result, previous)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"結果已存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
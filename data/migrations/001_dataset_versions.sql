@@ -0,0 +1,8 @@
+-- 景點增量同步：每筆景點的內容 hash，以及資料集版本
+ALTER TABLE attractions ADD COLUMN content_hash CHAR(40) AFTER images;
+
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
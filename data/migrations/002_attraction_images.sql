@@ -0,0 +1,5 @@
+-- 景點封面圖：attractions.cover_image 存第一張，預定、訂單只需要這張
+ALTER TABLE attractions ADD COLUMN cover_image VARCHAR(500) AFTER images;
+
+-- 從既有的 images JSON 補資料 (之後由 load_attractions.py 維護)
+UPDATE attractions SET cover_image = JSON_UNQUOTE(JSON_EXTRACT(images, '$[0]'));
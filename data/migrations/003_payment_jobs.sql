@@ -0,0 +1,14 @@
+-- 非同步付款：下單時同一個交易寫入付款工作，背景 worker 處理 (scripts/payment_worker.py)
+CREATE TABLE IF NOT EXISTS payment_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    order_number VARCHAR(20) NOT NULL UNIQUE,
+    status VARCHAR(10) NOT NULL DEFAULT 'PENDING', -- PENDING / RUNNING / DONE / FAILED / RECONCILE (結果不明，等人工對帳)
+    attempts INT NOT NULL DEFAULT 0,
+    next_run_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- 什麼時候可以 (再) 執行
+    locked_until DATETIME, -- RUNNING 的期限，worker 當掉超過這個時間就會被別的 worker 接手
+    last_error TEXT,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_status_next_run (status, next_run_at),
+    FOREIGN KEY (order_number) REFERENCES orders(order_number)
+);
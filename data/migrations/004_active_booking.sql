@@ -0,0 +1,31 @@
+-- 每個會員最多一筆預定中 (status = 1) 的行程，以及一次完成覆蓋 + 新增的預存程序
+
+-- 先把既有的重複資料整理掉：每個會員只保留最新的一筆預定中
+UPDATE bookings AS b
+JOIN (
+    SELECT member_id, MAX(id) AS keep_id FROM bookings WHERE status = 1 GROUP BY member_id
+) AS latest ON latest.member_id = b.member_id
+SET b.status = 0
+WHERE b.status = 1 AND b.id <> latest.keep_id;
+
+-- 預定中才有值，其他狀態是 NULL (UNIQUE 允許多個 NULL)
+ALTER TABLE bookings
+    ADD COLUMN active_member_id INT AS (IF(status = 1, member_id, NULL)) STORED,
+    ADD UNIQUE KEY uq_active_booking (active_member_id);
+
+DROP PROCEDURE IF EXISTS replace_booking;
+DELIMITER //
+CREATE PROCEDURE replace_booking(
+    IN p_member_id INT,
+    IN p_attraction_id INT,
+    IN p_booking_date DATE,
+    IN p_booking_time VARCHAR(20),
+    IN p_price INT
+)
+BEGIN
+    -- 之前的預定改成已覆蓋，再新增這筆 (交易由呼叫端 commit)
+    UPDATE bookings SET status = 0 WHERE member_id = p_member_id AND status = 1;
+    INSERT INTO bookings (member_id, attraction_id, booking_date, booking_time, price, status)
+    VALUES (p_member_id, p_attraction_id, p_booking_date, p_booking_time, p_price, 1);
+END //
+DELIMITER ;
@@ -0,0 +1,35 @@
+-- 訂單列表 (GET /api/orders)：景點摘要、行程日期直接存在訂單上，列表不用再 JOIN bookings、attractions
+ALTER TABLE orders
+    ADD COLUMN booking_date DATE AFTER price,
+    ADD COLUMN booking_time VARCHAR(20) AFTER booking_date,
+    ADD COLUMN attraction_id INT AFTER booking_time,
+    ADD COLUMN attraction_name VARCHAR(255) AFTER attraction_id;
+
+-- 列表依 created_at 排序、分頁；比較早建的 orders 沒有這個欄位的話先補上
+-- (MySQL 的 ADD COLUMN 沒有 IF NOT EXISTS，只能先查 information_schema 再決定要不要執行)
+SET @add_created_at = IF(
+    (SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'orders' AND COLUMN_NAME = 'created_at') = 0,
+    'ALTER TABLE orders ADD COLUMN created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP',
+    'DO 0'
+);
+PREPARE add_created_at FROM @add_created_at;
+EXECUTE add_created_at;
+DEALLOCATE PREPARE add_created_at;
+
+-- 既有的訂單從預定、景點補上
+UPDATE orders AS o
+JOIN bookings AS b ON b.id = o.booking_id
+JOIN attractions AS a ON a.id = b.attraction_id
+SET o.booking_date = b.booking_date,
+    o.booking_time = b.booking_time,
+    o.attraction_id = a.id,
+    o.attraction_name = a.name;
+
+-- 會員的訂單由新到舊，列表要的欄位都在索引裡，只讀索引就夠 (封面圖片不存在訂單上，列表用記憶體的景點資料)
+ALTER TABLE orders
+    ADD INDEX idx_member_created (member_id, created_at, id, status, order_number, price,
+        booking_date, booking_time, attraction_id, attraction_name);
+
+-- 原本 member_id 上的索引 (外鍵用的) 現在是多餘的，但各環境的索引名稱不一定一樣，這裡不刪；
+-- 要刪的話先用 SHOW INDEX FROM orders 查名稱再手動 DROP INDEX
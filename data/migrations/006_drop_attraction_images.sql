@@ -0,0 +1,2 @@
+-- attraction_images 沒有地方在讀 (圖片都從 images / cover_image 拿)，已經執行過舊版 002 的資料庫把它刪掉
+DROP TABLE IF EXISTS attraction_images;
@@ -0,0 +1,11 @@
+-- orders.attraction_image 沒有地方在讀 (訂單列表用記憶體的景點資料、單筆訂單 JOIN attractions.cover_image)
+-- 只有執行過舊版 005 的資料庫才有這個欄位，先查 information_schema 再決定要不要刪
+SET @drop_attraction_image = IF(
+    (SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'orders' AND COLUMN_NAME = 'attraction_image') > 0,
+    'ALTER TABLE orders DROP COLUMN attraction_image',
+    'DO 0'
+);
+PREPARE drop_attraction_image FROM @drop_attraction_image;
+EXECUTE drop_attraction_image;
+DEALLOCATE PREPARE drop_attraction_image;
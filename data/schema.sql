@@ -0,0 +1,108 @@
+-- 台北一日遊 資料表
+-- 用法：mysql -u <user> -p <database> < data/schema.sql
+-- 已經建好的資料庫，依序執行 data/migrations/ 裡新增的檔案升級
+
+CREATE TABLE IF NOT EXISTS attractions (
+    id INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    description TEXT NOT NULL,
+    address VARCHAR(255) NOT NULL,
+    transport TEXT NOT NULL,
+    mrt VARCHAR(50),
+    lat DECIMAL(9, 6) NOT NULL,
+    lng DECIMAL(9, 6) NOT NULL,
+    images TEXT NOT NULL, -- 圖片網址 list 的 JSON 字串
+    cover_image VARCHAR(500), -- 第一張圖片，預定、訂單只需要這張
+    content_hash CHAR(40), -- 來源資料的 sha1，同步時用來判斷有沒有變
+    INDEX idx_category (category),
+    INDEX idx_mrt (mrt)
+);
+
+-- 資料集版本，匯入/同步有變動時 +1，快取用它判斷資料是否更新
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS members (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(50) NOT NULL,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL -- bcrypt hash
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    member_id INT NOT NULL,
+    attraction_id INT NOT NULL,
+    booking_date DATE NOT NULL,
+    booking_time VARCHAR(20) NOT NULL, -- morning / afternoon
+    price INT NOT NULL,
+    status TINYINT NOT NULL DEFAULT 1, -- 0 已取消或被覆蓋、1 預定中、2 已下單
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    active_member_id INT AS (IF(status = 1, member_id, NULL)) STORED, -- 預定中才有值
+    INDEX idx_member_status (member_id, status),
+    UNIQUE KEY uq_active_booking (active_member_id), -- 每個會員最多一筆預定中
+    FOREIGN KEY (member_id) REFERENCES members(id),
+    FOREIGN KEY (attraction_id) REFERENCES attractions(id)
+);
+
+-- 新增預定：覆蓋之前的預定中 + 新增，一次呼叫完成
+DROP PROCEDURE IF EXISTS replace_booking;
+DELIMITER //
+CREATE PROCEDURE replace_booking(
+    IN p_member_id INT,
+    IN p_attraction_id INT,
+    IN p_booking_date DATE,
+    IN p_booking_time VARCHAR(20),
+    IN p_price INT
+)
+BEGIN
+    -- 之前的預定改成已覆蓋，再新增這筆 (交易由呼叫端 commit)
+    UPDATE bookings SET status = 0 WHERE member_id = p_member_id AND status = 1;
+    INSERT INTO bookings (member_id, attraction_id, booking_date, booking_time, price, status)
+    VALUES (p_member_id, p_attraction_id, p_booking_date, p_booking_time, p_price, 1);
+END //
+DELIMITER ;
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    order_number VARCHAR(20) NOT NULL UNIQUE,
+    booking_id INT NOT NULL,
+    member_id INT NOT NULL,
+    prime VARCHAR(255) NOT NULL,
+    contact_name VARCHAR(50) NOT NULL,
+    contact_email VARCHAR(255) NOT NULL,
+    contact_phone VARCHAR(10) NOT NULL,
+    price INT NOT NULL,
+    -- 下單時的行程與景點摘要，訂單列表直接用，不用 JOIN bookings、attractions
+    booking_date DATE,
+    booking_time VARCHAR(20),
+    attraction_id INT,
+    attraction_name VARCHAR(255),
+    status VARCHAR(10) NOT NULL DEFAULT 'UNPAID', -- UNPAID / PAID
+    payment_record TEXT, -- TapPay 回傳內容 (JSON)
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- 會員的訂單由新到舊，列表要的欄位都在索引裡，只讀索引就夠 (封面圖片不存在訂單上，列表用記憶體的景點資料)
+    INDEX idx_member_created (member_id, created_at, id, status, order_number, price,
+        booking_date, booking_time, attraction_id, attraction_name),
+    FOREIGN KEY (booking_id) REFERENCES bookings(id),
+    FOREIGN KEY (member_id) REFERENCES members(id)
+);
+
+-- 非同步付款的工作 (outbox)，跟訂單在同一個交易寫入，背景 worker 處理
+CREATE TABLE IF NOT EXISTS payment_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    order_number VARCHAR(20) NOT NULL UNIQUE,
+    status VARCHAR(10) NOT NULL DEFAULT 'PENDING', -- PENDING / RUNNING / DONE / FAILED / RECONCILE (結果不明，等人工對帳)
+    attempts INT NOT NULL DEFAULT 0,
+    next_run_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- 什麼時候可以 (再) 執行
+    locked_until DATETIME, -- RUNNING 的期限，worker 當掉超過這個時間就會被別的 worker 接手
+    last_error TEXT,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_status_next_run (status, next_run_at),
+    FOREIGN KEY (order_number) REFERENCES orders(order_number)
+);
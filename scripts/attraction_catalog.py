@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import mysql.connector
+from dotenv import load_dotenv
+# module
+from scripts import sql_connector
+from scripts.search_index import SearchIndex
+from scripts.geo_index import GeoIndex
+from scripts.json_response import dumps
+
+# 景點資料只在 load_attractions.py 匯入時才會變動，
+# 所以啟動時整包載入記憶體，API 直接查這裡，不用每個 request 都打資料庫
+# 匯入有變動時會把 dataset_versions 的版本 +1，watch() 定期檢查版本，變了就重新載入
+
+load_dotenv()
+
+# 幾秒檢查一次資料集版本，0 表示不檢查 (只在啟動時載入)
+REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+DATASET_NAME = "attractions"
+
+SQL_LOAD = "SELECT id, name, category, description, address, transport, mrt, lat, lng, images " \
+    "FROM attractions ORDER BY id;"
+SQL_DATASET_VERSION = "SELECT version, updated_at FROM dataset_versions WHERE name = %s;"
+SQL_START_SNAPSHOT = "START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;"
+
+# 某一個版本的景點資料，建好之後就不再修改 (要更新就整個換掉)
+class CatalogSnapshot:
+    def __init__(self, attractions: list[dict], version: str,
+                 dataset_version: int | None = None, modified_at: float | None = None):
+        self.version = version # 資料版本，內容不同版本就不同
+        self.dataset_version = dataset_version # 資料庫 dataset_versions 的版本號 (沒有就是 None)
+        self.loaded_at = time.time() # 載入時間 (unix time)
+        self.modified_at = modified_at or self.loaded_at # 資料最後變動時間，給 Last-Modified 用
+
+        # id -> 景點資料 (已經是 API 要回傳的格式)
+        self.by_id = {attr["id"]: attr for attr in attractions}
+        # 依 id 排序好的 id 列表
+        self.ids = sorted(self.by_id)
+        # id -> 已經轉好的 JSON (bytes)，回應時直接拼接，不用每次重新轉換
+        self.fragments = {attr_id: dumps(attr) for attr_id, attr in self.by_id.items()}
+        # 只帶封面 (第一張圖) 的版本，列表頁最常用 maxImages=1，也先轉好
+        self.cover_fragments = {
+            attr_id: dumps({**attr, "images": attr["images"][:1]}) if len(attr["images"]) > 1 else self.fragments[attr_id]
+            for attr_id, attr in self.by_id.items()
+        }
+
+        # 分類 -> id 列表、捷運站 -> id 列表 (都依 id 排序)
+        self.by_category = {}
+        self.by_mrt = {}
+        for attr_id in self.ids:
+            attr = self.by_id[attr_id]
+            self.by_category.setdefault(attr["category"], []).append(attr_id)
+            if attr["mrt"] is not None:
+                self.by_mrt.setdefault(attr["mrt"], []).append(attr_id)
+
+        # 分類、捷運站名稱，依景點數量由多到少排序 (數量相同維持出現順序)
+        self.categories = sorted(self.by_category, key=lambda cat: -len(self.by_category[cat]))
+        self.mrts = sorted(self.by_mrt, key=lambda mrt: -len(self.by_mrt[mrt]))
+
+        # /api/categories、/api/mrts 的回應內容只跟這份資料有關，載入時就先算好 JSON
+        # withCount=True 的版本多帶各名稱的景點數量
+        self.aggregate_bodies = {
+            ("categories", False): aggregate_body(self.categories, self.by_category, False),
+            ("categories", True): aggregate_body(self.categories, self.by_category, True),
+            ("mrts", False): aggregate_body(self.mrts, self.by_mrt, False),
+            ("mrts", True): aggregate_body(self.mrts, self.by_mrt, True)
+        }
+
+        # 關鍵字搜尋索引、經緯度空間索引
+        self.search_index = SearchIndex(attractions)
+        self.geo_index = GeoIndex(attractions)
+
+    def get(self, attraction_id: int) -> dict | None:
+        return self.by_id.get(attraction_id)
+
+    # 景點的 JSON 片段，max_images 有給就只帶前 N 張圖片
+    def fragment(self, attraction_id: int, max_images: int | None = None) -> bytes:
+        if max_images is None:
+            return self.fragments[attraction_id]
+        if max_images == 1:
+            return self.cover_fragments[attraction_id]
+        attr = self.by_id[attraction_id]
+        if len(attr["images"]) <= max_images:
+            return self.fragments[attraction_id]
+        return dumps({**attr, "images": attr["images"][:max_images]})
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# 分類/捷運站列表的 JSON 內容 (bytes)，格式跟 JSONResponse 產生的一樣
+def aggregate_body(names: list[str], index: dict[str, list[int]], with_count: bool) -> bytes:
+    content = {"data": names}
+    if with_count:
+        content["counts"] = {name: len(index[name]) for name in names}
+    return dumps(content)
+
+# 資料庫的一列 (tuple) 轉成 API 格式
+def row_to_attraction(row) -> dict:
+    return {
+        "id": row[0],
+        "name": row[1],
+        "category": row[2],
+        "description": row[3],
+        "address": row[4],
+        "transport": row[5],
+        "mrt": row[6],
+        "lat": float(row[7]),
+        "lng": float(row[8]),
+        "images": json.loads(row[9])
+    }
+
+# 用內容算版本號，同一份資料在每個 worker 算出來都一樣
+def compute_version(attractions: list[dict]) -> str:
+    content = json.dumps(attractions, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+# dataset_version 有值的話版本號會帶上它，方便對照是哪一次匯入
+def build_snapshot(attractions: list[dict], dataset_version: int | None = None,
+                   modified_at: float | None = None) -> CatalogSnapshot:
+    attractions = sorted(attractions, key=lambda attr: attr["id"])
+    version = compute_version(attractions)
+    if dataset_version is not None:
+        version = f"{dataset_version}-{version[:8]}"
+    return CatalogSnapshot(attractions, version, dataset_version, modified_at)
+
+def read_dataset_version(cursor) -> tuple[int, float] | None:
+    try:
+        cursor.execute(SQL_DATASET_VERSION, (DATASET_NAME, ))
+        row = cursor.fetchone()
+    except mysql.connector.Error as e:
+        print("讀取資料集版本失敗：", e)
+        return None
+    if not row:
+        return None
+    return row[0], row[1].timestamp()
+
+# 資料庫的資料集版本 -> (版本號, 更新時間)，還沒有版本紀錄 (或還沒建表) 就回傳 None
+def load_dataset_version() -> tuple[int, float] | None:
+    try:
+        with sql_connector.connection(readonly=True) as conn, conn.cursor() as cursor:
+            return read_dataset_version(cursor)
+    except mysql.connector.Error as e:
+        print("讀取資料集版本失敗：", e)
+        return None
+
+# 版本跟資料在同一條連線、同一個 snapshot 裡讀，不會拿到不同副本 (或匯入前後) 的組合
+def load_from_db() -> CatalogSnapshot:
+    with sql_connector.connection(readonly=True) as conn, conn.cursor() as cursor:
+        cursor.execute(SQL_START_SNAPSHOT)
+        try:
+            dataset = read_dataset_version(cursor)
+            cursor.execute(SQL_LOAD)
+            rows = cursor.fetchall()
+        finally:
+            conn.commit()
+    attractions = [row_to_attraction(row) for row in rows]
+    if dataset is None:
+        return build_snapshot(attractions)
+    return build_snapshot(attractions, dataset_version=dataset[0], modified_at=dataset[1])
+
+
+_snapshot: CatalogSnapshot | None = None
+_swap_lock = threading.Lock()
+
+# 取得目前的景點資料，還沒載入就報錯
+def get_catalog() -> CatalogSnapshot:
+    snapshot = _snapshot
+    if snapshot is None:
+        raise RuntimeError("景點資料尚未載入")
+    return snapshot
+
+def get_catalog_or_none() -> CatalogSnapshot | None:
+    return _snapshot
+
+def get_version() -> str | None:
+    return _snapshot.version if _snapshot else None
+
+# 換上新的資料，整個物件一次替換，正在處理中的 request 還是拿舊的那份，不會讀到一半
+def swap(snapshot: CatalogSnapshot) -> CatalogSnapshot:
+    global _snapshot
+    with _swap_lock:
+        _snapshot = snapshot
+    print(f"景點資料已載入：{len(snapshot)} 筆，版本 {snapshot.version}")
+    return snapshot
+
+# 重新載入景點資料
+# 沒給 attractions 就從資料庫讀；有給 (API 格式的 list) 就直接用它建新版本
+async def reload(attractions: list[dict] | None = None) -> CatalogSnapshot:
+    if attractions is None:
+        snapshot = await sql_connector.run_in_db(load_from_db)
+    else:
+        snapshot = build_snapshot(attractions)
+    return swap(snapshot)
+
+# 資料庫的版本跟目前載入的不一樣就重新載入，有重新載入回傳 True
+async def refresh_if_changed() -> bool:
+    dataset = await sql_connector.run_in_db(load_dataset_version)
+    if dataset is None:
+        return False
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.dataset_version == dataset[0]:
+        return False
+    await reload()
+    return True
+
+# 背景定期檢查資料集版本 (在 app lifespan 裡啟動)
+async def watch(interval: float = REFRESH_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_if_changed()
+        except Exception as e:
+            print("檢查景點資料版本失敗：", e)
@@ -1,15 +1,19 @@
-from fastapi import Header, Depends
+from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 import jwt
 import datetime
+import hashlib
 from datetime import timezone
 from dotenv import load_dotenv
 import os
+# module
+from scripts import password_hasher
+from scripts.ttl_cache import TTLCache, MISSING
 
 ## hash 處理
-# 設加密環境，用 bcrypt 演算法
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 設定 (bcrypt、工作係數) 在 password_hasher，API 裡請用 password_hasher 的 async 版本 (在獨立 process 計算)
+# 這裡的同步版本給指令碼用
+pwd_context = password_hasher.pwd_context
 
 # 明碼變亂碼 (hash)
 def get_password_hash(password):
@@ -38,14 +42,64 @@ def create_jwt_token(data: dict):
     encoded_token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_token
 
-# 驗證 token
+# 驗證 token (沒有登入、token 錯誤或過期都回傳 None)
+# 驗證過的結果放在快取裡，key 用 token 的 sha256，同一個 token 之後不用再 jwt.decode
+# 正確的 token 存到它的 exp 為止；錯誤的 token 也記一段時間，重複送來直接拒絕
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_NEGATIVE_TTL = float(os.getenv("AUTH_NEGATIVE_TTL", "60")) # 錯誤 token 記幾秒
+
+token_cache = TTLCache(max_size=AUTH_CACHE_SIZE)
+# 撤銷的 token 另外記 (不限筆數，到 exp 就自動清掉)，不會因為 LRU 被擠掉
+revoked_tokens = TTLCache(max_size=None)
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
 def get_user_data(token: str | None):
-    if token:
+    if not token:
+        return None
+    key = token_digest(token)
+    if key in revoked_tokens:
+        return None
+    payload = token_cache.get(key)
+    if payload is not MISSING:
+        return payload
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception as e:
+        print("JWT 驗證失敗", e)
+        token_cache.set(key, None, ttl=AUTH_NEGATIVE_TTL)
+        return None
+    token_cache.set(key, payload, expires_at=payload.get("exp"))
+    return payload
+
+# 撤銷 token (例如登出、改密碼)，到 token 原本的過期時間為止都會被拒絕
+def revoke_token(token: str):
+    key = token_digest(token)
+    payload = token_cache.get(key)
+    if payload is MISSING or payload is None:
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            return payload
-        except Exception as e:
-            print("JWT 驗證失敗", e)
-            return None
-    
-    
\ No newline at end of file
+        except Exception:
+            return # 本來就無效，不用記
+    revoked_tokens.set(key, True, expires_at=payload.get("exp"))
+    token_cache.delete(key)
+
+## 共用的登入驗證 (FastAPI dependency)
+# 抓取 request header 中的 Authorization: Bearer <token>
+# tokenUrl 是給 Swagger UI 測試用的，auto_error=false 不要自動報錯，而是回傳 none
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/auth", auto_error=False)
+
+# 目前登入的會員，沒登入回傳 None
+# 快取命中只是查 dict，用 async 直接在 event loop 跑，不用再丟到 threadpool
+async def get_current_user(token: str | None = Depends(oauth2_scheme)) -> dict | None:
+    return get_user_data(token)
+
+# 一定要登入的 API 用這個，沒登入回 403
+async def require_user(user_data: dict | None = Depends(get_current_user)) -> dict:
+    if not user_data:
+        raise HTTPException(
+            status_code=403,
+            detail="未登入系統，拒絕存取。"
+        )
+    return user_data
@@ -0,0 +1,105 @@
+import os
+import secrets
+import threading
+from dotenv import load_dotenv
+# module
+from scripts.ttl_cache import TTLCache, MISSING
+
+# 每個會員目前的預定行程 (GET /api/booking 的回應內容) 快取
+# 預定只會在新增、刪除預定、下單時改變，這三個地方 commit 後清掉快取，
+# 讀取時命中就不用查資料庫；沒有預定 ({"data": None}) 也會存，導覽列每頁都會查
+# 預設存在這個 process 的記憶體，多個 worker/多台機器時換成共享的 backend，
+# 不然別的 worker 寫入後，這裡最多要等 BOOKING_CACHE_TTL 秒才會看到
+
+load_dotenv()
+
+BOOKING_CACHE_TTL = float(os.getenv("BOOKING_CACHE_TTL", "30")) # 秒，0 表示不快取
+BOOKING_CACHE_MAX_SIZE = int(os.getenv("BOOKING_CACHE_MAX_SIZE", "10000")) # 最多記幾個會員
+
+#region backend
+# 查資料庫期間有人寫入的話，查到的可能是舊的，不能存進快取，所以讀取時先放一個占位 (lease)：
+#   - 沒有快取時 lease() 放一個只有自己知道的 token，查完資料庫再 fill()，占位還是自己的才存進去
+#   - 寫入後 delete() 連占位一起清掉，之前開始查的就存不進去
+# 判斷都在 backend 裡做，換成共享的 backend 後，別台機器的寫入一樣擋得住
+# 共享的 backend 要實作 get (沒有或是占位就回傳 MISSING) / lease / fill (比對 token 再寫入，例如 Redis 的 SET NX + Lua) / delete
+# 會在 threadpool 裡呼叫，可以是同步的網路操作
+class BookingCacheBackend:
+    def get(self, member_id: int):
+        raise NotImplementedError
+
+    # 沒有快取也沒有別人的占位時放一個占位，成功回傳 True
+    def lease(self, member_id: int, token: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    # 占位還是 token 的話換成 payload，成功回傳 True
+    def fill(self, member_id: int, token: str, payload: dict, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def delete(self, member_id: int):
+        raise NotImplementedError
+
+class Lease:
+    def __init__(self, token: str):
+        self.token = token
+
+class MemoryBackend(BookingCacheBackend):
+    def __init__(self, max_size: int = BOOKING_CACHE_MAX_SIZE):
+        self._cache = TTLCache(max_size=max_size)
+        self._lock = threading.Lock() # lease、fill 的檢查跟寫入要一起做
+
+    def get(self, member_id: int):
+        value = self._cache.get(member_id)
+        return MISSING if isinstance(value, Lease) else value
+
+    def lease(self, member_id: int, token: str, ttl: float) -> bool:
+        with self._lock:
+            if self._cache.get(member_id) is not MISSING:
+                return False
+            self._cache.set(member_id, Lease(token), ttl=ttl)
+            return True
+
+    def fill(self, member_id: int, token: str, payload: dict, ttl: float) -> bool:
+        with self._lock:
+            value = self._cache.get(member_id)
+            if not isinstance(value, Lease) or value.token != token:
+                return False
+            self._cache.set(member_id, payload, ttl=ttl)
+            return True
+
+    def delete(self, member_id: int):
+        with self._lock:
+            self._cache.delete(member_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+backend: BookingCacheBackend = MemoryBackend()
+
+# 換成共享的 backend (在 app 啟動前呼叫)
+def set_backend(new_backend: BookingCacheBackend):
+    global backend
+    backend = new_backend
+#endregion
+
+LEASE_SECONDS = 10 # 占位最多留幾秒 (查資料庫的程式當掉也不會一直占著)
+
+# 取得會員的預定行程，沒有快取就用 loader() 查資料庫再存起來
+def load(member_id: int, loader) -> dict:
+    if BOOKING_CACHE_TTL <= 0:
+        return loader()
+    payload = backend.get(member_id)
+    if payload is not MISSING:
+        return payload
+    # 別人正在查 (已經有占位) 就自己查，不存
+    token = secrets.token_hex(8)
+    leased = backend.lease(member_id, token, LEASE_SECONDS)
+    payload = loader()
+    if leased:
+        backend.fill(member_id, token, payload, BOOKING_CACHE_TTL)
+    return payload
+
+# 寫入 commit 之後呼叫，清掉讓下次重新查
+# 不直接存新的內容：同時有兩筆寫入時，存進快取的順序不一定跟資料庫 commit 的順序一樣
+def invalidate(member_id: int):
+    if BOOKING_CACHE_TTL > 0:
+        backend.delete(member_id)
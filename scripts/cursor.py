@@ -0,0 +1,24 @@
+import base64
+import json
+
+# 分頁用的 cursor：把「最後一筆的位置」包成看不懂的字串給前端，
+# 下一頁再原封不動傳回來，後端解開後直接從那個位置往後找 (keyset pagination)
+
+class InvalidCursor(ValueError):
+    pass
+
+# dict -> base64url 字串 (去掉結尾的 =)
+def encode_cursor(position: dict) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+# base64url 字串 -> dict，格式不對就丟 InvalidCursor
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise InvalidCursor("cursor 格式不正確")
+    if not isinstance(position, dict):
+        raise InvalidCursor("cursor 格式不正確")
+    return position
@@ -0,0 +1,98 @@
+import math
+
+# 景點經緯度的格狀空間索引 (grid index)
+# 把地圖切成 CELL_DEG 度見方的格子，每個格子記錄裡面有哪些景點，
+# 找附近景點時從中心格子一圈一圈往外找，只對附近格子裡的景點算距離，不用掃全部
+
+CELL_DEG = 0.01 # 一格約 1 公里
+EARTH_RADIUS = 6371000 # 公尺
+METERS_PER_DEG = math.pi * EARTH_RADIUS / 180 # 緯度一度約 111 公里
+
+# 兩點的球面距離 (公尺)
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+def cell_of(lat: float, lng: float) -> tuple[int, int]:
+    return (math.floor(lat / CELL_DEG), math.floor(lng / CELL_DEG))
+
+class GeoIndex:
+    def __init__(self, attractions: list[dict]):
+        self.cells = {} # (格子 row, col) -> [(id, lat, lng), ...]
+        for attr in attractions:
+            if attr["lat"] is None or attr["lng"] is None:
+                continue
+            self.cells.setdefault(cell_of(attr["lat"], attr["lng"]), []).append((attr["id"], attr["lat"], attr["lng"]))
+        # 有景點的格子的範圍 (row 最小、最大，col 最小、最大)，範圍外不用找
+        rows = [row for row, _ in self.cells]
+        cols = [col for _, col in self.cells]
+        self.bounds = (min(rows), max(rows), min(cols), max(cols)) if self.cells else None
+        # 景點的緯度範圍
+        lats = [lat for points in self.cells.values() for _, lat, _ in points]
+        self.lat_range = (min(lats), max(lats)) if lats else None
+
+    # (lat) 半徑 radius 公尺內可能有景點嗎 (緯度方向一度的距離是固定的)
+    def covers_lat(self, lat: float, radius: float) -> bool:
+        if not self.lat_range:
+            return False
+        margin = radius / METERS_PER_DEG
+        return self.lat_range[0] - margin <= lat <= self.lat_range[1] + margin
+
+    # 第 ring 圈的格子 (跟中心格子的距離剛好是 ring 格)，只回傳 bounds (row 最小、最大，col 最小、最大) 裡面的
+    @staticmethod
+    def _ring(center: tuple[int, int], ring: int, bounds: tuple[int, int, int, int]):
+        row, col = center
+        min_row, max_row, min_col, max_col = bounds
+        if ring == 0:
+            yield center
+            return
+        # 上下兩排
+        for r in (row - ring, row + ring):
+            if min_row <= r <= max_row:
+                for c in range(max(col - ring, min_col), min(col + ring, max_col) + 1):
+                    yield (r, c)
+        # 左右兩排 (不含角落)
+        for c in (col - ring, col + ring):
+            if min_col <= c <= max_col:
+                for r in range(max(row - ring + 1, min_row), min(row + ring - 1, max_row) + 1):
+                    yield (r, c)
+
+    # 找 (lat, lng) 半徑 radius 公尺內最近的 limit 個景點，回傳 [(距離, id), ...] 由近到遠
+    def nearby(self, lat: float, lng: float, radius: float, limit: int, exclude: int | None = None) -> list[tuple[float, int]]:
+        if not self.cells:
+            return []
+        row, col = center = cell_of(lat, lng)
+        # 只找有景點的範圍，而且緯度方向超過半徑的格子也不用找 (緯度一格的長度是固定的)
+        # 不然高緯度時經度方向一格很短，圈數會多到卡住 event loop
+        row_reach = math.ceil(radius / (CELL_DEG * METERS_PER_DEG)) + 1
+        min_row, max_row, min_col, max_col = self.bounds
+        bounds = (max(min_row, row - row_reach), min(max_row, row + row_reach), min_col, max_col)
+        if bounds[0] > bounds[1]:
+            return []
+        # 範圍內的格子離中心最近、最遠幾圈
+        first_ring = max(0, bounds[0] - row, row - bounds[1], bounds[2] - col, col - bounds[3])
+        last_ring = max(abs(row - bounds[0]), abs(row - bounds[1]), abs(col - bounds[2]), abs(col - bounds[3]))
+
+        # 一格最短的邊長 (公尺)，經度方向會隨緯度變短
+        cell_meters = CELL_DEG * METERS_PER_DEG * max(math.cos(math.radians(min(abs(lat) + CELL_DEG, 90))), 1e-6)
+        max_ring = min(math.ceil(radius / cell_meters) + 1, last_ring)
+
+        found = []
+        for ring in range(first_ring, max_ring + 1):
+            for cell in self._ring(center, ring, bounds):
+                for attr_id, attr_lat, attr_lng in self.cells.get(cell, ()):
+                    if attr_id == exclude:
+                        continue
+                    distance = haversine(lat, lng, attr_lat, attr_lng)
+                    if distance <= radius:
+                        found.append((distance, attr_id))
+            # 還沒找過的格子，裡面的點至少離 ring * 一格 那麼遠
+            # 已經找到 limit 個比這更近的，外圈就不可能更近，可以停了
+            if len(found) >= limit:
+                found.sort()
+                if found[limit - 1][0] <= ring * cell_meters:
+                    break
+        found.sort()
+        return found[:limit]
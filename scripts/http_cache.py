@@ -0,0 +1,121 @@
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qsl
+from dotenv import load_dotenv
+from fastapi import Request, Response
+# module
+from scripts import attraction_catalog
+
+# HTTP 快取 (ETag / Last-Modified / Cache-Control)
+# 景點相關的 GET 回應只跟「資料版本 + 網址」有關，所以不用先產生內容就能算出 ETag，
+# 瀏覽器或 CDN 帶著上次的 ETag 回來問，一樣就直接回 304，不用再跑 API 也不用再傳內容
+
+load_dotenv()
+
+# 各路由的 Cache-Control，可以用環境變數 CACHE_CONTROL_<名稱> 整串覆蓋，例如
+# CACHE_CONTROL_ATTRACTIONS="public, max-age=30, stale-while-revalidate=120"
+DEFAULT_CACHE_CONTROL = {
+    "attractions": "public, max-age=60, stale-while-revalidate=300",
+    "attraction": "public, max-age=60, stale-while-revalidate=300",
+    "categories": "public, max-age=300, stale-while-revalidate=3600",
+    "mrts": "public, max-age=300, stale-while-revalidate=3600"
+}
+CACHE_CONTROL = {
+    name: os.getenv(f"CACHE_CONTROL_{name.upper()}", value)
+    for name, value in DEFAULT_CACHE_CONTROL.items()
+}
+
+# 路徑 -> 路由名稱，結尾是 / 的用開頭比對，其他要完全一樣
+CACHE_ROUTES = [
+    ("/api/attractions", "attractions"),
+    ("/api/attractions/batch", "attractions"),
+    ("/api/attractions/nearby", "attractions"),
+    ("/api/attraction/", "attraction"),
+    ("/api/categories", "categories"),
+    ("/api/mrts", "mrts")
+]
+
+def match_route(path: str) -> str | None:
+    for prefix, name in CACHE_ROUTES:
+        if path == prefix or (prefix.endswith("/") and path.startswith(prefix)):
+            return name
+    return None
+
+# 產生強 ETag，例如 "3f2a9c..."
+def make_etag(*parts) -> str:
+    key = "|".join(str(part) for part in parts)
+    return '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+# 比對 request 的 If-None-Match 跟目前的 ETag (If-None-Match 用弱比對，忽略 W/)
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+# 沒有 If-None-Match 才看 If-Modified-Since (精確到秒)
+def is_not_modified(headers, etag: str, last_modified: float) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# 304 回應，不帶內容
+def not_modified(cache_headers: dict) -> Response:
+    return Response(status_code=304, headers=cache_headers)
+
+# 這個 request 的快取標頭，資料還沒載入就回傳 None (不快取)
+def cache_headers_for(name: str, path: str, query_string: str) -> dict | None:
+    catalog = attraction_catalog.get_catalog_or_none()
+    if catalog is None:
+        return None
+    # 查詢參數排序過，順序不同的同一個查詢拿到同一個 ETag
+    query = sorted(parse_qsl(query_string, keep_blank_values=True))
+    return {
+        "ETag": make_etag(catalog.version, path, query),
+        "Last-Modified": formatdate(catalog.modified_at, usegmt=True),
+        "Cache-Control": CACHE_CONTROL[name]
+    }
+
+# ASGI middleware：只處理 CACHE_ROUTES 的 GET (這些路由只註冊了 GET)
+#   - 條件符合直接回 304，不進到 API
+#   - 200 回應補上 ETag、Last-Modified、Cache-Control
+class HTTPCacheMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        name = match_route(scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+        cache_headers = cache_headers_for(name, scope["path"], scope["query_string"].decode("latin-1"))
+        if cache_headers is None:
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        if is_not_modified(request.headers, cache_headers["ETag"], attraction_catalog.get_catalog().modified_at):
+            return await not_modified(cache_headers)(scope, receive, send)
+
+        async def send_with_cache_headers(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = [(key, value) for key, value in message.get("headers", [])
+                           if key.lower() not in (b"etag", b"last-modified", b"cache-control")]
+                headers += [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in cache_headers.items()]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import os
+from dotenv import load_dotenv
+from fastapi import Request
+# module
+from scripts import auth
+from scripts.json_response import FastJSONResponse
+from scripts.ttl_cache import TTLCache, MISSING
+
+# Idempotency-Key：網路不穩的 client 重送下單/預定時，不要再扣一次款、再寫一次資料庫
+# 同一個會員帶同一個 Idempotency-Key 的請求只會真的執行一次：
+#   - 已經完成的：直接回傳當時存下來的回應 (加上 Idempotent-Replayed: true)
+#   - 還在處理中的：等第一個處理完，拿同一份回應
+#   - 同一個 key 但內容不一樣：422
+# 5xx 不存，client 可以用同一個 key 重試；3xx (例如 /api/booking 轉址到 /api/booking/) 也不存，轉址後的請求才是真的執行
+# 回應存在 store 裡，預設是這個 process 的記憶體；多台機器要共用的話換成共享的 store (例如 Redis)
+
+load_dotenv()
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60))) # 回應保留幾秒
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+MAX_KEY_LENGTH = 255
+
+# 支援 Idempotency-Key 的路由 (method, path)，path 不含結尾的 /
+IDEMPOTENT_ROUTES = {
+    ("POST", "/api/orders"),
+    ("POST", "/api/booking")
+}
+
+#region store
+# 共享的 store 只要實作 get / put
+class IdempotencyStore:
+    async def get(self, key: tuple):
+        raise NotImplementedError
+
+    async def put(self, key: tuple, record: dict, ttl: float):
+        raise NotImplementedError
+
+class MemoryStore(IdempotencyStore):
+    def __init__(self, max_size: int = IDEMPOTENCY_MAX_KEYS):
+        self._cache = TTLCache(max_size=max_size)
+
+    async def get(self, key: tuple):
+        record = self._cache.get(key)
+        return None if record is MISSING else record
+
+    async def put(self, key: tuple, record: dict, ttl: float):
+        self._cache.set(key, record, ttl=ttl)
+
+store: IdempotencyStore = MemoryStore()
+
+# 換成共享的 store (在 app 啟動前呼叫)
+def set_store(new_store: IdempotencyStore):
+    global store
+    store = new_store
+#endregion
+
+# 處理中的請求：key -> Future (完成時是存下來的回應)
+_in_flight: dict[tuple, asyncio.Future] = {}
+
+def error_response(status_code: int, message: str) -> FastJSONResponse:
+    return FastJSONResponse(
+        status_code=status_code,
+        content={
+            "error": True,
+            "message": message
+        }
+    )
+
+# 把存下來的回應送出去
+async def replay(record: dict, send):
+    headers = record["headers"] + [(b"idempotent-replayed", b"true")]
+    await send({"type": "http.response.start", "status": record["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": record["body"]})
+
+# 讀完整個 request body，再包成新的 receive 給後面的 app 用
+async def read_body(receive) -> tuple[bytes, callable]:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    body = b"".join(chunks)
+    sent = False
+
+    async def replay_receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay_receive
+
+# ASGI middleware：只處理 IDEMPOTENT_ROUTES 而且有帶 Idempotency-Key 的請求
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # 有沒有結尾的 / 都當成同一個請求 (/api/booking 會轉址到 /api/booking/，帶著同一個 key)
+        path = scope["path"].rstrip("/")
+        if (scope["method"], path) not in IDEMPOTENT_ROUTES:
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        idempotency_key = request.headers.get("idempotency-key")
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return await error_response(400, "Idempotency-Key 太長")(scope, receive, send)
+
+        # 沒登入就照常處理 (會回 403)，key 只在同一個會員底下有效
+        authorization = request.headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        user_data = auth.get_user_data(token) if scheme.lower() == "bearer" else None
+        if not user_data:
+            return await self.app(scope, receive, send)
+
+        body, replay_receive = await read_body(receive)
+        fingerprint = hashlib.sha256(scope["method"].encode() + b" " + path.encode() + b"\n" + body).hexdigest()
+        key = (user_data["id"], idempotency_key)
+
+        # 已經完成過，或是有同一個 key 正在處理
+        record = await store.get(key)
+        future = _in_flight.get(key)
+        if record is None and future is not None:
+            record = await asyncio.shield(future)
+        if record is not None:
+            if record["fingerprint"] != fingerprint:
+                return await error_response(422, "這個 Idempotency-Key 已經用在不同的請求")(scope, receive, send)
+            return await replay(record, send)
+
+        # 第一次：真的執行，同時把回應記下來
+        future = asyncio.get_running_loop().create_future()
+        _in_flight[key] = future
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        record = None
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            record = {
+                "fingerprint": fingerprint,
+                "status": response["status"],
+                "headers": response["headers"],
+                "body": b"".join(response["body"])
+            }
+            if record["status"] < 300 or 400 <= record["status"] < 500:
+                await store.put(key, record, IDEMPOTENCY_TTL)
+        finally:
+            del _in_flight[key]
+            # 等在後面的重複請求拿同一份回應 (出錯的話給它們 500)
+            if record is None:
+                error = error_response(500, "系統錯誤，請稍後再試。")
+                record = {"fingerprint": fingerprint, "status": 500, "headers": error.raw_headers, "body": error.body}
+            future.set_result(record)
@@ -0,0 +1,27 @@
+from fastapi.responses import JSONResponse, Response
+import json
+
+# 有裝 orjson 就用它來轉 JSON (C 實作，比內建 json 快很多)，沒裝就退回內建 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 物件 -> JSON bytes，格式跟 JSONResponse 一樣 (UTF-8、不轉義中文、不留空白)
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# 用法跟 JSONResponse 一樣，只是轉 JSON 比較快
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+# 內容已經是組好的 JSON bytes，直接送出不再轉換
+class RawJSONResponse(Response):
+    media_type = "application/json"
+
+# 把已經轉好的 JSON 片段 (bytes) 組成陣列
+def join_array(fragments) -> bytes:
+    return b"[" + b",".join(fragments) + b"]"
@@ -1,54 +1,233 @@
 import mysql.connector
+import argparse
+import hashlib
 import json
 from dotenv import load_dotenv
 import os
 import re
+import sys
+import time
+
+# 匯入景點資料到 attractions 表
+# 可以重複執行：已經有的景點會更新，沒有的會新增，全部在同一個交易裡，失敗就整批 rollback
+# 每筆景點存一個內容 hash，--sync 模式只寫入有變動的、刪掉來源已經沒有的
+# 有任何變動就把 dataset_versions 的 attractions 版本 +1，網站的快取會跟著更新
+# 用法 (在專案根目錄)：python scripts/load_attractions.py [--sync] [--file data/taipei-attractions.json] [--batch-size 500]
 
 load_dotenv()
 
-# 取JSON資料
-with open("./data/taipei-attractions.json", "r", encoding="utf-8-sig", newline="") as file:
-    data = json.load(file)
-
-# 景點陣列
-attractions = data["result"]["results"]
-# print(attractions)
-
-# 連線資料庫
-conn = mysql.connector.connect(
-    host=os.getenv("DB_HOST"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    database=os.getenv("DB_NAME")
-)
-
-
-try:
-    with conn.cursor() as cursor:
-        # [item]*10 會生成一個list裡面有10個item
-        # "分割符號".join(list) 用分割符號連接所有list的item成一個string
-        item = ",".join(["%s"] * 10) 
-        # 用 f-string 插入 %s 不會有 SQL injection 的問題
-        sql = f"INSERT INTO attractions (id, name, category, description, address, transport, mrt, lat, lng, images) " \
-                "VALUES ( %s, %s, %s, %s, %s, %s, %s, %s, %s, %s )"
-        for attr in attractions:
-            # 抓各個值
-            id = attr.get("_id")
-            name = attr.get("name")
-            category = attr.get("CAT")
-            description = attr.get("description")
-            address = attr.get("address")
-            transport = attr.get("direction")
-            mrt = attr.get("MRT")
-            lat = float(attr.get("latitude", 0))
-            lng = float(attr.get("longitude", 0))
-            # 處理檔案url，分割成list並且篩出圖片部分
-            url_list = re.findall(r"https://.*?(?=https://|$)", attr["file"]) # .*? 非貪婪匹配任意字元， (?=pattern) lookahead=>找下段字串的開頭(不包含在本段字串)
-            img_list = [u for u in url_list if u.endswith((".jpg", ".JPG", ".png", ".PNG"))]
-            images = json.dumps(img_list) # 轉成JSON型態
-            # print(type(images))
-            cursor.execute(sql, (id, name, category, description, address, transport, mrt, lat, lng, images))
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "taipei-attractions.json")
+COLUMNS = ["id", "name", "category", "description", "address", "transport", "mrt", "lat", "lng", "images", "cover_image", "content_hash"]
+DATASET_NAME = "attractions"
+
+# 一次寫入 (已存在就更新)
+SQL_UPSERT = f"INSERT INTO attractions ({', '.join(COLUMNS)}) " \
+    f"VALUES ({', '.join(['%s'] * len(COLUMNS))}) " \
+    "ON DUPLICATE KEY UPDATE " + ", ".join(f"{col} = VALUES({col})" for col in COLUMNS[1:])
+
+# 來源已經沒有的景點，被預定過的 (bookings 還參照著) 先保留
+SQL_DELETE_REMOVED = "DELETE FROM attractions WHERE id IN ({}) " \
+    "AND NOT EXISTS (SELECT 1 FROM bookings WHERE bookings.attraction_id = attractions.id);"
+
+SQL_BUMP_VERSION = "INSERT INTO dataset_versions (name, version) VALUES (%s, 1) " \
+    "ON DUPLICATE KEY UPDATE version = version + 1;"
+
+#region 讀檔：逐筆解析 result.results 陣列，不用一次把整個 JSON 轉成物件
+def iter_attractions(path: str, chunk_size: int = 64 * 1024):
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        buffer = ""
+        eof = False
+
+        def fill():
+            nonlocal buffer, eof
+            chunk = file.read(chunk_size)
+            if chunk:
+                buffer += chunk
+            else:
+                eof = True
+
+        # 找到 "results": [ 的位置
+        while True:
+            match = re.search(r'"results"\s*:\s*\[', buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            if eof:
+                raise ValueError("找不到 results 陣列")
+            fill()
+
+        # 一筆一筆解析，資料不完整就再多讀一段
+        while True:
+            buffer = buffer.lstrip(" \t\r\n,")
+            if buffer.startswith("]"):
+                return
+            try:
+                attr, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            yield attr
+            buffer = buffer[end:]
+#endregion
+
+#region 轉換：整理成資料表的欄位，一批一批處理
+# 處理檔案url，分割成list並且篩出圖片部分
+# .*? 非貪婪匹配任意字元， (?=pattern) lookahead=>找下段字串的開頭(不包含在本段字串)
+URL_PATTERN = re.compile(r"https://.*?(?=https://|$)")
+IMAGE_EXTENSIONS = (".jpg", ".JPG", ".png", ".PNG")
+
+def extract_images(file_field: str | None) -> list[str]:
+    url_list = URL_PATTERN.findall(file_field or "")
+    return [u for u in url_list if u.endswith(IMAGE_EXTENSIONS)]
+
+# 內容 hash：同樣的資料算出來一定一樣
+def content_hash(values: tuple) -> str:
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def to_row(attr: dict) -> tuple:
+    img_list = extract_images(attr.get("file"))
+    values = (
+        int(attr["_id"]),
+        attr["name"],
+        attr.get("CAT"),
+        attr.get("description"),
+        attr.get("address"),
+        attr.get("direction"),
+        attr.get("MRT"),
+        float(attr.get("latitude") or 0),
+        float(attr.get("longitude") or 0),
+        json.dumps(img_list) # 轉成JSON型態
+    )
+    cover_image = img_list[0] if img_list else None
+    return values + (cover_image, content_hash(values))
+
+# 一批原始資料 -> (可寫入的資料列, 跳過的筆數)
+def transform_batch(batch: list[dict]) -> tuple[list[tuple], int]:
+    rows = []
+    skipped = 0
+    for attr in batch:
+        try:
+            rows.append(to_row(attr))
+        except (KeyError, TypeError, ValueError) as e:
+            skipped += 1
+            print(f"略過格式錯誤的景點 {attr.get('_id')}：{e!r}")
+    return rows, skipped
+
+def batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+#endregion
+
+def connect():
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME")
+    )
+
+# sync=False：全部寫入 (已存在的覆蓋)；sync=True：只寫入 hash 不同的，並刪除來源已經沒有的
+def load(path: str, batch_size: int, sync: bool = False) -> dict:
+    started = time.perf_counter()
+    stats = {"read": 0, "skipped": 0, "inserted": 0, "updated": 0, "unchanged": 0,
+             "deleted": 0, "kept": 0, "version": None, "parse_s": 0.0, "write_s": 0.0}
+
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            # autocommit 是關的，從這裡到 commit 都在同一個交易裡
+            # 先拿到已經存在的 id 跟 hash，才能分出新增、更新、沒變的
+            cursor.execute("SELECT id, content_hash FROM attractions;")
+            existing = dict(cursor.fetchall())
+            seen_ids = set()
+
+            batches = batched(iter_attractions(path), batch_size)
+            while True:
+                parse_start = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                rows, skipped = transform_batch(batch)
+                stats["parse_s"] += time.perf_counter() - parse_start
+                stats["read"] += len(batch)
+                stats["skipped"] += skipped
+
+                changed_rows = []
+                for row in rows:
+                    attr_id, row_hash = row[0], row[-1]
+                    seen_ids.add(attr_id)
+                    if attr_id not in existing:
+                        stats["inserted"] += 1
+                        changed_rows.append(row)
+                    elif existing[attr_id] != row_hash:
+                        stats["updated"] += 1
+                        changed_rows.append(row)
+                    else:
+                        stats["unchanged"] += 1
+                    existing[attr_id] = row_hash
+
+                write_start = time.perf_counter()
+                rows_to_write = changed_rows if sync else rows
+                if rows_to_write:
+                    cursor.executemany(SQL_UPSERT, rows_to_write) # 一批組成一句多筆的 INSERT
+                stats["write_s"] += time.perf_counter() - write_start
+
+            write_start = time.perf_counter()
+            if sync:
+                removed_ids = [attr_id for attr_id in existing if attr_id not in seen_ids]
+                if removed_ids:
+                    cursor.execute(SQL_DELETE_REMOVED.format(", ".join(["%s"] * len(removed_ids))), removed_ids)
+                    stats["deleted"] = cursor.rowcount
+                    stats["kept"] = len(removed_ids) - cursor.rowcount
+
+            # 有變動才換版本，沒變的話快取都不用更新
+            if stats["inserted"] or stats["updated"] or stats["deleted"]:
+                cursor.execute(SQL_BUMP_VERSION, (DATASET_NAME, ))
+                cursor.execute("SELECT version FROM dataset_versions WHERE name = %s;", (DATASET_NAME, ))
+                stats["version"] = cursor.fetchone()[0]
+
             conn.commit()
+            stats["write_s"] += time.perf_counter() - write_start
+    except Exception:
+        conn.rollback() # 全部撤銷，資料表維持匯入前的樣子
+        raise
+    finally:
+        conn.close()
+
+    stats["total_s"] = time.perf_counter() - started
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="匯入景點資料")
+    parser.add_argument("--file", default=DEFAULT_FILE, help="景點 JSON 檔")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批寫入幾筆")
+    parser.add_argument("--sync", action="store_true", help="只寫入有變動的景點，並刪除來源已經沒有的")
+    args = parser.parse_args()
+
+    try:
+        stats = load(args.file, args.batch_size, sync=args.sync)
+    except Exception as e:
+        print("匯入景點失敗，已全部 rollback：", e)
+        sys.exit(1)
+
+    print(f"讀取 {stats['read']} 筆，新增 {stats['inserted']} 筆，更新 {stats['updated']} 筆，"
+          f"沒變 {stats['unchanged']} 筆，略過 {stats['skipped']} 筆")
+    if args.sync:
+        print(f"刪除 {stats['deleted']} 筆，來源已移除但仍有預定而保留 {stats['kept']} 筆")
+    if stats["version"] is None:
+        print("資料沒有變動，版本不變")
+    else:
+        print(f"資料集版本更新為 {stats['version']}")
+    print(f"解析 {stats['parse_s']:.3f}s，寫入 {stats['write_s']:.3f}s，總共 {stats['total_s']:.3f}s")
 
-except Exception as e:
-    print(e)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+# bcrypt 密碼 hash 專用的 process pool
+# bcrypt 每次都要幾十到幾百毫秒的純 CPU，放在共用的 threadpool 裡，一堆人同時登入就會卡住其他 API
+# 所以丟到獨立的 process 算，同時排隊的數量有上限，等太久就直接回 503，只有登入變慢，不影響景點 API
+
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # 工作係數，+1 計算時間就變兩倍
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // 2)))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 4))) # 同時在算 + 排隊的上限
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "5")) # 排隊最多等幾秒
+
+# 設加密環境，用 bcrypt 演算法
+# min/max 都設成 BCRYPT_ROUNDS：工作係數改了之後，舊的 hash 在登入時會被判定需要重新 hash
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+class HasherBusy(Exception):
+    """排隊太久，拿不到計算的名額"""
+
+
+#region 在子 process 裡執行的部分 (要是模組層級的函式才能傳過去)
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+# 回傳 (密碼是否正確, 需要更新的新 hash 或 None)
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+def _ping() -> bool:
+    return True
+#endregion
+
+_executor: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(HASH_MAX_PENDING)
+    return _slots
+
+# 在 app 啟動時先把子 process 開好 (在其他 thread 開始跑之前 fork，第一次登入也不用等開 process)
+async def start():
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_get_executor(), _ping)
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+# 拿到名額才送去子 process 算，等超過 HASH_QUEUE_TIMEOUT 秒就放棄
+async def _run(func, *args):
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HasherBusy("密碼驗證忙碌中")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    except BrokenProcessPool:
+        # 子 process 被砍掉 (例如 OOM) 之後整個 pool 都不能用，丟掉重開，下一個 request 就正常
+        shutdown()
+        raise
+    finally:
+        slots.release()
+
+# 明碼變亂碼 (hash)
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+# 驗證密碼，回傳 (是否正確, 新的 hash)；工作係數有改時第二個值是用新係數重算的 hash，要存回資料庫
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await _run(_verify_and_update, password, hashed_password)
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+from dotenv import load_dotenv
+# module
+from scripts import sql_connector, tappay
+
+# 非同步付款的背景 worker
+# 非同步下單時，訂單跟 payment_jobs 的一筆工作在同一個交易寫入 (outbox)，API 馬上回應「付款處理中」
+# worker 從 payment_jobs 領工作 (FOR UPDATE SKIP LOCKED，需要 MySQL 8.0，多個 worker 不會領到同一筆)，打 TapPay，把結果寫回 orders
+#   - 連不上 TapPay (請求沒送出) 會延後重試，超過次數就標成失敗
+#   - 付款被拒就直接失敗，不重試
+#   - 停止時不再領新工作，處理中的付款等它做完 (最多 DRAIN_SECONDS 秒)
+#   - worker 處理到一半當掉，RUNNING 超過 locked_until 的工作會被重新領取，重啟也不會掉單；
+#     但付款請求可能已經送出、已經扣款 (prime 只能用一次，再付一次會被拒絕)，
+#     所以重新領取的工作不再付款，改用訂單編號查 TapPay 的交易紀錄，查不出結果就標成 RECONCILE 等人工對帳
+# 可以跟網站一起跑 (app lifespan 裡的背景 task)，也可以另外開：python -m scripts.payment_worker
+
+load_dotenv()
+
+# inprocess：跟網站一起跑；off：不跑 (另外用 python -m scripts.payment_worker 跑)
+PAYMENT_WORKER = os.getenv("PAYMENT_WORKER", "inprocess")
+CONCURRENCY = int(os.getenv("PAYMENT_WORKER_CONCURRENCY", "4")) # 同時處理幾筆
+POLL_SECONDS = float(os.getenv("PAYMENT_WORKER_POLL_SECONDS", "2")) # 沒工作時多久檢查一次
+MAX_ATTEMPTS = int(os.getenv("PAYMENT_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = 2 # 第 n 次失敗後等 RETRY_BASE_SECONDS * 2^(n-1) 秒再試
+LOCK_SECONDS = int(tappay.CONNECT_TIMEOUT * (tappay.MAX_RETRIES + 1) + tappay.READ_TIMEOUT + 30) # 一次處理最久多久
+DRAIN_SECONDS = float(os.getenv("PAYMENT_WORKER_DRAIN_SECONDS", str(LOCK_SECONDS))) # 停止時最多等處理中的付款幾秒
+
+# 可以領的工作：時間到的 PENDING，或是 worker 當掉留下來、已經超過期限的 RUNNING
+SQL_CLAIM = """
+    SELECT id, status FROM payment_jobs
+    WHERE (status = 'PENDING' AND next_run_at <= NOW())
+        OR (status = 'RUNNING' AND locked_until < NOW())
+    ORDER BY next_run_at
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED;
+"""
+SQL_MARK_RUNNING = "UPDATE payment_jobs SET status = 'RUNNING', attempts = attempts + 1, " \
+    "locked_until = NOW() + INTERVAL %s SECOND WHERE id IN ({});"
+SQL_JOB_DETAILS = """
+    SELECT j.id, j.order_number, j.attempts, o.prime, o.price, o.member_id,
+        o.contact_name, o.contact_email, o.contact_phone
+    FROM payment_jobs j
+    JOIN orders o ON o.order_number = j.order_number
+    WHERE j.id IN ({});
+"""
+SQL_ORDER_PAID = "UPDATE orders SET status = 'PAID', payment_record = %s WHERE order_number = %s;"
+SQL_ORDER_PAYMENT_FAILED = "UPDATE orders SET payment_record = %s WHERE order_number = %s;"
+SQL_JOB_DONE = "UPDATE payment_jobs SET status = %s, locked_until = NULL, last_error = %s WHERE id = %s;"
+SQL_JOB_RETRY = "UPDATE payment_jobs SET status = 'PENDING', locked_until = NULL, last_error = %s, " \
+    "next_run_at = NOW() + INTERVAL %s SECOND WHERE id = %s;"
+SQL_JOB_RECONCILE = "UPDATE payment_jobs SET status = 'RECONCILE', locked_until = NULL, last_error = %s WHERE id = %s;"
+SQL_ENQUEUE = "INSERT INTO payment_jobs (order_number) VALUES (%s);"
+
+# 在下單的交易裡呼叫 (同一個 cursor)，跟訂單一起 commit
+def enqueue(cursor, order_number: str):
+    cursor.execute(SQL_ENQUEUE, (order_number, ))
+
+# 領取最多 limit 筆工作，回傳工作內容 (含付款需要的訂單資料)
+# reclaimed=True 表示上次處理到一半被中斷 (領取時還是 RUNNING)
+def claim_jobs(limit: int) -> list[dict]:
+    with sql_connector.connection() as conn, conn.cursor(dictionary=True) as cursor:
+        cursor.execute(SQL_CLAIM, (limit, ))
+        claimed = cursor.fetchall()
+        ids = [row["id"] for row in claimed]
+        reclaimed = {row["id"] for row in claimed if row["status"] == "RUNNING"}
+        if not ids:
+            conn.rollback()
+            return []
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(SQL_MARK_RUNNING.format(placeholders), (LOCK_SECONDS, *ids))
+        cursor.execute(SQL_JOB_DETAILS.format(placeholders), ids)
+        jobs = cursor.fetchall()
+        conn.commit()
+    for job in jobs:
+        job["reclaimed"] = job["id"] in reclaimed
+    return jobs
+
+# 把付款結果寫回訂單跟工作 (同一個交易)
+def finish_job(job: dict, tappay_res: dict):
+    paid = tappay_res.get("status") == 0
+    retry = not paid and tappay_res.get("retryable") and job["attempts"] < MAX_ATTEMPTS
+    with sql_connector.connection() as conn, conn.cursor() as cursor:
+        if retry:
+            delay = RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+            cursor.execute(SQL_JOB_RETRY, (tappay_res.get("msg"), delay, job["id"]))
+        else:
+            payment_record = json.dumps(tappay_res)
+            cursor.execute(SQL_ORDER_PAID if paid else SQL_ORDER_PAYMENT_FAILED, (payment_record, job["order_number"]))
+            cursor.execute(SQL_JOB_DONE, ("DONE" if paid else "FAILED", None if paid else tappay_res.get("msg"), job["id"]))
+        conn.commit()
+    if not retry:
+        sql_connector.mark_written(job["member_id"]) # 會員接下來查訂單走主資料庫，馬上看得到結果
+
+# 不知道結果的付款交給人工對帳，不再自動處理
+def flag_for_reconciliation(job: dict, message: str):
+    with sql_connector.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(SQL_JOB_RECONCILE, (message, job["id"]))
+        conn.commit()
+    print(f"[付款 worker] 訂單 {job['order_number']} 需要人工對帳：{message}")
+
+# 上次處理到一半的工作：查 TapPay 有沒有扣款，不重新付款
+async def reconcile_job(job: dict):
+    trade = await tappay.query_trade(job["order_number"])
+    if trade is None:
+        await sql_connector.run_in_db(flag_for_reconciliation, job, "付款處理中斷，查不到 TapPay 交易結果")
+    elif trade["paid"]:
+        await sql_connector.run_in_db(finish_job, job, {**trade["record"], "status": 0, "msg": "Success"})
+    else:
+        await sql_connector.run_in_db(finish_job, job, {"status": 1, "msg": "付款處理中斷，TapPay 沒有扣款紀錄"})
+
+async def process_job(job: dict):
+    if job["reclaimed"]:
+        return await reconcile_job(job)
+    contact = SimpleNamespace(name=job["contact_name"], email=job["contact_email"], phone=job["contact_phone"])
+    try:
+        tappay_res = await tappay.post_tappay_api(job["prime"], job["price"], contact, order_number=job["order_number"])
+    except Exception as e:
+        tappay_res = {"status": 1, "msg": f"發生未知錯誤: {str(e)}"}
+    await sql_connector.run_in_db(finish_job, job, tappay_res)
+
+#region worker 迴圈
+_wake: asyncio.Event | None = None
+
+def _get_wake() -> asyncio.Event:
+    global _wake
+    if _wake is None:
+        _wake = asyncio.Event()
+    return _wake
+
+# 有新工作時叫醒同一個 process 裡的 worker，不用等到下一次輪詢
+def notify():
+    if _wake is not None:
+        _wake.set()
+
+async def run(concurrency: int = CONCURRENCY, poll_seconds: float = POLL_SECONDS):
+    wake = _get_wake()
+    running = set()
+    try:
+        await _loop(wake, running, concurrency, poll_seconds)
+    finally:
+        # 停止時不再領新工作，處理中的付款做完才結束 (取消的話付款結果就沒寫回去)
+        # 等太久還沒做完的才取消，那些工作超過 locked_until 之後會被重新領取、查交易紀錄
+        if running:
+            print(f"[付款 worker] 停止中，等待 {len(running)} 筆處理中的付款")
+            _, pending = await asyncio.wait(running, timeout=DRAIN_SECONDS)
+            for task in pending:
+                task.cancel()
+
+async def _loop(wake: asyncio.Event, running: set, concurrency: int, poll_seconds: float):
+    while True:
+        wake.clear() # 先清掉，領工作期間有新的通知就不會漏掉
+        free = concurrency - len(running)
+        if free > 0:
+            claim = asyncio.ensure_future(sql_connector.run_in_db(claim_jobs, free))
+            try:
+                await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                # 停止時領取可能已經 commit (工作已經是 RUNNING)，等它回來，領到的工作交給 run() 做完
+                await asyncio.wait([claim])
+                raise
+            except Exception:
+                pass # 錯誤在 _start_jobs 裡印出
+            finally:
+                _start_jobs(claim, running)
+        # 等新工作通知、有工作做完 (空出位子)，或是到下一次輪詢
+        waiter = asyncio.create_task(wake.wait())
+        try:
+            await asyncio.wait([waiter, *running], timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+
+def _start_jobs(claim: asyncio.Future, running: set):
+    if claim.exception():
+        print("[付款 worker] 領取工作失敗：", claim.exception())
+        return
+    for job in claim.result():
+        task = asyncio.create_task(process_job(job))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(_report_error)
+
+def _report_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        print("[付款 worker] 處理工作失敗：", task.exception())
+#endregion
+
+# 獨立執行：python -m scripts.payment_worker
+async def main():
+    await tappay.start()
+    await sql_connector.run_in_db(sql_connector.warm_up)
+    print(f"[付款 worker] 啟動，同時處理 {CONCURRENCY} 筆")
+    try:
+        await run()
+    finally:
+        await tappay.close()
+        sql_connector.close_all()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from fastapi import Request
+# module
+from scripts import auth
+from scripts.json_response import FastJSONResponse
+
+# 限流與准入控制 (admission control)
+# 登入/註冊要算 bcrypt、下單要打 TapPay，比查景點貴很多，所以這幾個路由另外限制：
+#   - 每個 IP、每個會員各一個 token bucket，用完就回 429 + Retry-After
+#   - 每個路由同時處理的數量有上限，滿了也回 429，不讓 request 在後面排隊拖垮整台
+# bucket 狀態放在 backend，預設是這個 process 的記憶體；多台機器要共用的話換成共享的 backend (例如 Redis)
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+# 前面有幾層自己的反向代理 (nginx、負載平衡)，0 表示直接對外
+# 每層代理都會把看到的來源 IP 接在 X-Forwarded-For 最後面，所以從右邊數第 N 個才是真正的 client；
+# 左邊的是 client 自己帶的，可以亂填，不能拿來當限流的 key
+TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000")) # 記憶體 backend 最多記幾個 bucket
+
+# 每分鐘補 per_minute 個，最多存 burst 個 (可以一次用完)
+@dataclass(frozen=True)
+class Limit:
+    per_minute: float
+    burst: int
+
+    @property
+    def per_second(self) -> float:
+        return self.per_minute / 60
+
+@dataclass(frozen=True)
+class RouteRule:
+    name: str
+    per_ip: Limit | None = None
+    per_member: Limit | None = None # 有登入才算
+    max_concurrency: int | None = None # 這個 process 同時處理的上限
+
+# 環境變數 "每分鐘,burst"，例如 RATE_LIMIT_SIGN_IN_PER_IP=10,5；設成 0 表示不限
+def env_limit(name: str, default: str) -> Limit | None:
+    value = os.getenv(name, default).strip()
+    if value in ("", "0"):
+        return None
+    per_minute, _, burst = value.partition(",")
+    return Limit(float(per_minute), int(burst or per_minute))
+
+# 同時處理上限，0 表示不限
+def env_concurrency(name: str, default: int) -> int | None:
+    return int(os.getenv(name, str(default))) or None
+
+# (method, path) -> 規則
+ROUTE_RULES = {
+    ("PUT", "/api/user/auth"): RouteRule(
+        "sign_in",
+        per_ip=env_limit("RATE_LIMIT_SIGN_IN_PER_IP", "10,5"),
+        max_concurrency=env_concurrency("RATE_LIMIT_SIGN_IN_CONCURRENCY", 16)
+    ),
+    ("POST", "/api/user/"): RouteRule(
+        "sign_up",
+        per_ip=env_limit("RATE_LIMIT_SIGN_UP_PER_IP", "5,3"),
+        max_concurrency=env_concurrency("RATE_LIMIT_SIGN_UP_CONCURRENCY", 8)
+    ),
+    ("POST", "/api/orders"): RouteRule(
+        "orders",
+        per_ip=env_limit("RATE_LIMIT_ORDERS_PER_IP", "20,10"),
+        per_member=env_limit("RATE_LIMIT_ORDERS_PER_MEMBER", "6,3"),
+        max_concurrency=env_concurrency("RATE_LIMIT_ORDERS_CONCURRENCY", 20)
+    )
+}
+
+#region backend
+# 共享的 backend 只要實作 take：扣 cost 個 token，夠就回傳 0，不夠回傳還要等幾秒
+class RateLimitBackend:
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        raise NotImplementedError
+
+# 這個 process 的記憶體，bucket 太多時丟掉最久沒用到的 (等於讓那個 client 重新開始算)
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict() # key -> (剩下的 token, 上次更新時間)
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.per_second)
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / limit.per_second
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return wait
+
+backend: RateLimitBackend = MemoryBackend()
+
+# 換成共享的 backend (在 app 啟動前呼叫)
+def set_backend(new_backend: RateLimitBackend):
+    global backend
+    backend = new_backend
+#endregion
+
+#region 同時處理數量
+_in_flight = {} # 規則名稱 -> 正在處理的數量
+
+def try_enter(rule: RouteRule) -> bool:
+    if rule.max_concurrency is None:
+        return True
+    count = _in_flight.get(rule.name, 0)
+    if count >= rule.max_concurrency:
+        return False
+    _in_flight[rule.name] = count + 1
+    return True
+
+def leave(rule: RouteRule):
+    if rule.max_concurrency is not None:
+        _in_flight[rule.name] -= 1
+
+def stats() -> dict:
+    return dict(_in_flight)
+#endregion
+
+def client_ip(request: Request) -> str:
+    if TRUSTED_PROXIES > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if forwarded:
+            # 比代理層數少的話，最左邊那個就是第一層代理看到的來源
+            return forwarded[-min(TRUSTED_PROXIES, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
+# 檢查這個 request 的所有 bucket，回傳要等幾秒 (0 表示放行)
+# 每個 bucket 分別檢查，有一個不夠就回傳其中最久的等待時間
+async def check_buckets(rule: RouteRule, request: Request) -> float:
+    wait = 0.0
+    if rule.per_ip:
+        wait = max(wait, await backend.take(f"{rule.name}:ip:{client_ip(request)}", rule.per_ip))
+    if rule.per_member:
+        authorization = request.headers.get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        user_data = auth.get_user_data(token) if scheme.lower() == "bearer" else None
+        if user_data:
+            wait = max(wait, await backend.take(f"{rule.name}:member:{user_data['id']}", rule.per_member))
+    return wait
+
+def too_many_requests(retry_after: float) -> FastJSONResponse:
+    return FastJSONResponse(
+        status_code=429,
+        content={
+            "error": True,
+            "message": "請求太頻繁，請稍後再試。"
+        },
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+# ASGI middleware：只處理 ROUTE_RULES 裡的路由，其他的直接放行
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        rule = ROUTE_RULES.get((scope["method"], scope["path"]))
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        wait = await check_buckets(rule, Request(scope))
+        if wait > 0:
+            return await too_many_requests(wait)(scope, receive, send)
+        if not try_enter(rule):
+            return await too_many_requests(1)(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            leave(rule)
@@ -0,0 +1,105 @@
+# 景點關鍵字搜尋用的倒排索引 (inverted index)
+# 中文沒有空白斷詞，所以把文字切成「相鄰兩個字」(bigram) 當作索引的詞：
+#   "北投公園" -> "北投", "投公", "公園"
+# 查詢時把關鍵字也切成 bigram，拿每個 bigram 的景點 id 集合 (posting list) 取交集，
+# 再確認關鍵字真的有完整出現在欄位裡，最後依出現的欄位加權排序
+
+# 要建索引的欄位與權重，權重越高排越前面
+SEARCH_FIELDS = {
+    "name": 8,
+    "mrt": 6,
+    "address": 2,
+    "description": 1
+}
+EXACT_MATCH_BONUS = 10 # 欄位內容跟關鍵字完全一樣 (例如捷運站名) 再加分
+
+# 統一大小寫、全形空白
+def normalize(text: str | None) -> str:
+    if not text:
+        return ""
+    return text.replace("　", " ").lower()
+
+# 切成 bigram，只有一個字的話就用那個字
+def ngrams(text: str) -> set[str]:
+    if len(text) < 2:
+        return {text} if text and not text.isspace() else set()
+    grams = set()
+    for i in range(len(text) - 1):
+        gram = text[i:i + 2]
+        if not gram.isspace():
+            grams.add(gram)
+    return grams
+
+class SearchIndex:
+    def __init__(self, attractions: list[dict], fields: dict[str, int] = SEARCH_FIELDS):
+        self.fields = fields
+        self.texts = {} # id -> {欄位: 正規化後的文字}，用來確認是否完整出現
+        self.bigrams = {} # bigram -> {id, ...}
+        self.unigrams = {} # 單一字 -> {id, ...}，給一個字的查詢用
+
+        for attr in attractions:
+            texts = {field: normalize(attr.get(field)) for field in fields}
+            self.texts[attr["id"]] = texts
+            for text in texts.values():
+                for gram in ngrams(text):
+                    self.bigrams.setdefault(gram, set()).add(attr["id"])
+                for char in text:
+                    if not char.isspace():
+                        self.unigrams.setdefault(char, set()).add(attr["id"])
+
+    # 找出包含這個詞的候選 id (可能有誤判，之後還要確認)
+    def _candidates(self, term: str) -> set[int]:
+        if len(term) == 1:
+            return self.unigrams.get(term, set())
+        postings = []
+        for gram in ngrams(term):
+            posting = self.bigrams.get(gram)
+            if not posting: # 有任何一個 bigram 沒出現過，一定找不到
+                return set()
+            postings.append(posting)
+        # 從最短的 posting list 開始取交集，比較快
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def _score(self, attr_id: int, terms: list[str]) -> int:
+        texts = self.texts[attr_id]
+        score = 0
+        for term in terms:
+            term_score = 0
+            for field, weight in self.fields.items():
+                text = texts[field]
+                if term in text:
+                    term_score += weight
+                    if text == term:
+                        term_score += EXACT_MATCH_BONUS
+            if term_score == 0: # 其中一個詞沒有完整出現 (只是 bigram 剛好都有)，不算符合
+                return 0
+            score += term_score
+        return score
+
+    # 查詢，回傳依分數由高到低排序的 id 列表 (分數相同依 id)
+    # 關鍵字用空白隔開的話，每個詞都要出現
+    def search(self, query: str) -> list[int]:
+        terms = normalize(query).split()
+        if not terms:
+            return []
+
+        candidates = None
+        for term in terms:
+            found = self._candidates(term)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return []
+
+        scored = []
+        for attr_id in candidates:
+            score = self._score(attr_id, terms)
+            if score:
+                scored.append((-score, attr_id))
+        scored.sort()
+        return [attr_id for _, attr_id in scored]
@@ -1,22 +1,361 @@
 import mysql.connector
-from mysql.connector import pooling
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import deque
 from dotenv import load_dotenv
+import asyncio
+import functools
+import itertools
+import threading
+import time
 import os
+# module
+from scripts.ttl_cache import TTLCache
 
 # 載入 .env (存環境變數的檔案，不把內容上傳public)
 load_dotenv()
 
-# 建立一個連線池
-connection_pool = pooling.MySQLConnectionPool(
-    pool_name="my_website_pool",
-    pool_size=5, # 池子裡最多養幾條連線
-    pool_reset_session=True,  # 每次拿連線時會重置狀態，避免髒資料
-    host=os.getenv("DB_HOST"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    database=os.getenv("DB_NAME")
-)
-
-def get_connection():
-        # 每次呼叫這個函式，是從池子裡「借」一條連線，而不是重新建立
-        return connection_pool.get_connection()
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME")
+}
+
+# 連線池設定，都可以用環境變數調整
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "2")) # 平常至少留著幾條連線
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "10")) # 最多開幾條連線
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5")) # 連線都在用時最多排隊等幾秒
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300")) # 閒置超過幾秒就關掉 (保留 POOL_MIN_SIZE 條)
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")) # 一條連線最多用幾秒就換新的
+POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30")) # 閒置超過幾秒，借出前先 ping 確認還活著
+
+class PoolTimeout(Exception):
+    pass
+
+# 可伸縮的連線池
+#   - 連線不夠時在 POOL_MAX_SIZE 內加開，滿了就排隊等，等超過 timeout 才丟 PoolTimeout
+#   - 借出前檢查連線：太舊的換新、閒置太久的先 ping
+#   - 用 stats() 看目前狀況
+class ConnectionPool:
+    def __init__(self, config: dict, min_size: int, max_size: int, timeout: float,
+                 max_idle: float, max_lifetime: float, ping_after: float):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque() # (連線, 建立時間, 上次歸還時間)，右邊是最近還回來的
+        self._created_at = {} # id(連線) -> 建立時間
+        self._size = 0 # 目前開著的連線數 (含借出中、建立中)
+        self._in_use = 0
+        self._waiters = 0
+        # 統計
+        self._total_created = 0
+        self._total_recycled = 0
+        self._total_timeouts = 0
+        self._wait_count = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # 借出前的檢查，不能用就回傳 False
+    def _usable(self, conn, created_at: float, released_at: float) -> bool:
+        now = time.monotonic()
+        if now - created_at > self.max_lifetime or now - released_at > self.max_idle:
+            return False
+        if now - released_at > self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    # 借一條連線
+    def acquire(self, timeout: float | None = None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        while True:
+            idle_item = None
+            with self._cond:
+                # 有閒置的就拿最近還回來的 (最可能還活著)；還沒到上限就開新的；滿了就排隊
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._total_timeouts += 1
+                        raise PoolTimeout(f"等待資料庫連線超過 {timeout} 秒")
+                    self._waiters += 1
+                    waited = True
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+                if self._idle:
+                    idle_item = self._idle.pop()
+                else:
+                    self._size += 1
+                self._in_use += 1
+
+            # 檢查、連線都在鎖外面做，不擋住其他人
+            if idle_item:
+                conn, created_at, released_at = idle_item
+                if self._usable(conn, created_at, released_at):
+                    with self._cond:
+                        self._record_wait(start, waited)
+                    return conn
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._total_recycled += 1
+                self._discard(conn)
+                continue
+
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._total_created += 1
+                self._record_wait(start, waited)
+            return conn
+
+    def _record_wait(self, start: float, waited: bool):
+        if waited:
+            wait_time = time.monotonic() - start
+            self._wait_count += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+
+    # 還連線，沒 commit 的交易會 rollback，壞掉的直接丟掉
+    # 要關掉的連線在鎖裡面先挑出來，關連線 (網路 I/O) 在鎖外面做，不擋住其他人
+    def release(self, conn):
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = conn.is_connected()
+        except Exception:
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                created_at = self._created_at.get(id(conn), time.monotonic())
+                self._idle.append((conn, created_at, time.monotonic()))
+                to_close = []
+            else:
+                self._size -= 1
+                to_close = [conn]
+            to_close += self._prune()
+            self._cond.notify()
+        for old_conn in to_close:
+            self._discard(old_conn)
+
+    # 挑出閒置太久的連線 (要在鎖裡面呼叫)，但至少留 min_size 條 (最舊的在左邊)，回傳要關掉的連線
+    def _prune(self) -> list:
+        now = time.monotonic()
+        to_close = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][2] > self.max_idle:
+            conn, _, _ = self._idle.popleft()
+            self._size -= 1
+            self._total_recycled += 1
+            to_close.append(conn)
+        return to_close
+
+    # 先開好 min_size 條連線 (啟動時呼叫)
+    def warm_up(self):
+        conns = []
+        try:
+            while self._size < self.min_size:
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                self.release(conn)
+
+    def close_all(self):
+        with self._cond:
+            to_close = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(to_close)
+        for conn in to_close:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self._total_created,
+                "recycled": self._total_recycled,
+                "timeouts": self._total_timeouts,
+                "wait_count": self._wait_count,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 2),
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 2)
+            }
+
+# 讀寫分離：寫入走主資料庫 (DB_HOST)，唯讀查詢可以分到唯讀副本
+# DB_REPLICA_HOSTS 用逗號分隔，可以帶 port，例如 "10.0.0.2,10.0.0.3:3307"，帳號密碼跟主資料庫一樣
+REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+# 會員寫入後幾秒內，他的唯讀查詢還是走主資料庫，避免副本還沒同步而讀不到剛寫的資料
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+def create_pool(config: dict) -> ConnectionPool:
+    return ConnectionPool(
+        config,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        timeout=POOL_TIMEOUT,
+        max_idle=POOL_MAX_IDLE,
+        max_lifetime=POOL_MAX_LIFETIME,
+        ping_after=POOL_PING_AFTER
+    )
+
+def replica_config(host: str) -> dict:
+    config = dict(DB_CONFIG)
+    host, _, port = host.partition(":")
+    config["host"] = host
+    if port:
+        config["port"] = int(port)
+    return config
+
+# 建立連線池 (連線用到時才開，啟動時用 warm_up() 先開好 POOL_MIN_SIZE 條)
+connection_pool = create_pool(DB_CONFIG)
+replica_pools = [create_pool(replica_config(host)) for host in REPLICA_HOSTS]
+_replica_turn = itertools.count() # 輪流使用各個副本
+
+# 專門跑資料庫 I/O 的執行緒池，數量跟所有連線池的上限加起來一樣大
+db_executor = ThreadPoolExecutor(max_workers=POOL_MAX_SIZE * (1 + len(replica_pools)), thread_name_prefix="db")
+
+#region 最近寫入的會員 (read-your-writes)
+# 記在 backend 裡，過了 READ_YOUR_WRITES_SECONDS 自動失效
+# 預設是這個 process 的記憶體；uvicorn --workers N 或是另外跑 payment_worker 時，
+# 寫入跟之後的讀取可能在不同 process，要換成共享的 backend (例如 Redis 的 SET key EX)，不然還是可能讀到副本的舊資料
+# 共享的 backend 只要實作 mark / recent (會在 db_executor 的 thread 裡呼叫，可以是同步的網路操作)
+class RecentWritesBackend:
+    def mark(self, member_id: int, seconds: float):
+        raise NotImplementedError
+
+    def recent(self, member_id: int) -> bool:
+        raise NotImplementedError
+
+class MemoryRecentWrites(RecentWritesBackend):
+    def __init__(self, max_size: int = 10000):
+        self._cache = TTLCache(max_size=max_size)
+
+    def mark(self, member_id: int, seconds: float):
+        self._cache.set(member_id, True, ttl=seconds)
+
+    def recent(self, member_id: int) -> bool:
+        return member_id in self._cache
+
+recent_writes: RecentWritesBackend = MemoryRecentWrites()
+
+# 換成共享的 backend (在 app、payment_worker 啟動前呼叫)
+def set_recent_writes_backend(new_backend: RecentWritesBackend):
+    global recent_writes
+    recent_writes = new_backend
+
+# 會員寫入 (預定、下單) commit 之後呼叫
+def mark_written(member_id: int):
+    if replica_pools:
+        recent_writes.mark(member_id, READ_YOUR_WRITES_SECONDS)
+
+def wrote_recently(member_id: int | None) -> bool:
+    if member_id is None:
+        return False
+    return recent_writes.recent(member_id)
+#endregion
+
+# 這次要用哪個連線池
+def choose_pool(readonly: bool, member_id: int | None) -> ConnectionPool:
+    if readonly and replica_pools and not wrote_recently(member_id):
+        return replica_pools[next(_replica_turn) % len(replica_pools)]
+    return connection_pool
+
+# 從池子裡「借」一條連線，離開 with 自動還回去 (沒 commit 的會 rollback)
+# readonly=True 的查詢會分到副本 (沒設定副本就還是主資料庫)；
+# 帶 member_id 的話，這個會員剛寫入過就改走主資料庫
+# 用法：
+#   with sql_connector.connection() as conn:
+#       with conn.cursor() as cursor: ...
+#   with sql_connector.connection(readonly=True, member_id=user_id) as conn: ...
+@contextmanager
+def connection(readonly: bool = False, member_id: int | None = None):
+    pool = choose_pool(readonly, member_id)
+    try:
+        conn = pool.acquire()
+    except Exception as e:
+        if pool is connection_pool:
+            raise
+        # 副本連不上就退回主資料庫
+        print("唯讀副本連線失敗，改用主資料庫：", e)
+        pool = connection_pool
+        conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def pool_stats() -> dict:
+    return {
+        "primary": connection_pool.stats(),
+        "replicas": {host: pool.stats() for host, pool in zip(REPLICA_HOSTS, replica_pools)}
+    }
+
+def warm_up():
+    for pool in [connection_pool, *replica_pools]:
+        pool.warm_up()
+
+def close_all():
+    for pool in [connection_pool, *replica_pools]:
+        pool.close_all()
+
+# 給 async 的 handler 用：把會卡住的資料庫操作丟到 db_executor 執行，不會擋住 event loop
+# 用法：result = await sql_connector.run_in_db(func, arg1, arg2)
+async def run_in_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+
+# 借一條連線執行一句 SQL 並取回全部結果，執行完就把連線還回池子
+def fetch_all(sql, parameters=(), dictionary=False, readonly=False):
+    with connection(readonly=readonly) as conn:
+        with conn.cursor(dictionary=dictionary) as cursor:
+            cursor.execute(sql, parameters)
+            return cursor.fetchall()
+
+def fetch_one(sql, parameters=(), dictionary=False, readonly=False):
+    with connection(readonly=readonly) as conn:
+        with conn.cursor(dictionary=dictionary) as cursor:
+            cursor.execute(sql, parameters)
+            return cursor.fetchone()
+
+# async 版本
+async def fetch_all_async(sql, parameters=(), dictionary=False, readonly=False):
+    return await run_in_db(fetch_all, sql, parameters, dictionary=dictionary, readonly=readonly)
+
+async def fetch_one_async(sql, parameters=(), dictionary=False, readonly=False):
+    return await run_in_db(fetch_one, sql, parameters, dictionary=dictionary, readonly=readonly)
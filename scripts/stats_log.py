@@ -0,0 +1,24 @@
+import asyncio
+import json
+import os
+from dotenv import load_dotenv
+# module
+from scripts import sql_connector, tappay
+
+# 定期把執行狀況 (資料庫連線池、TapPay 呼叫次數與耗時) 印到 log，看有沒有在排隊等連線、逾時、付款變慢
+# 在 app lifespan 裡當背景 task 跑
+
+load_dotenv()
+
+STATS_LOG_SECONDS = float(os.getenv("STATS_LOG_SECONDS", "300")) # 多久印一次，0 表示不印
+
+def snapshot() -> dict:
+    return {
+        "db_pool": sql_connector.pool_stats(),
+        "tappay": tappay.stats()
+    }
+
+async def run(interval: float = STATS_LOG_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        print("[執行狀況]", json.dumps(snapshot(), ensure_ascii=False))
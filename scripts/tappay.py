@@ -1,16 +1,93 @@
+import asyncio
 import httpx
 import os
+import time
+from collections import deque
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # TapPay 設定
-TAPPAY_URL = "https://sandbox.tappaysdk.com/tpc/payment/pay-by-prime"
+# TAPPAY_URL 可以用環境變數換成本機的假 TapPay (scripts/tappay_stub.py)
+TAPPAY_URL = os.getenv("TAPPAY_URL", "https://sandbox.tappaysdk.com/tpc/payment/pay-by-prime")
+# 交易紀錄查詢 (Record API)，付款 worker 確認中斷的付款有沒有扣款用
+TAPPAY_RECORD_URL = os.getenv("TAPPAY_RECORD_URL", "https://sandbox.tappaysdk.com/tpc/transaction/query")
 PARTNER_KEY = os.getenv("TAPPAY_PARTNER_KEY")
 MERCHANT_ID = os.getenv("TAPPAY_MERCHANT_ID")
 
+# 連線設定：整個 app 共用一個 client，連線會保留下來重複使用，不用每筆付款都重新 TCP + TLS 握手
+CONNECT_TIMEOUT = float(os.getenv("TAPPAY_CONNECT_TIMEOUT", "3")) # 連線建立 (連不上要快點知道)
+READ_TIMEOUT = float(os.getenv("TAPPAY_READ_TIMEOUT", "30")) # 等 TapPay 回應 (授權可能比較久)
+MAX_CONNECTIONS = int(os.getenv("TAPPAY_MAX_CONNECTIONS", "20"))
+KEEPALIVE_SECONDS = float(os.getenv("TAPPAY_KEEPALIVE_SECONDS", "60"))
+# 只有「連不上」才重試：請求還沒送出去，不會重複扣款；送出後逾時就不重試
+MAX_RETRIES = int(os.getenv("TAPPAY_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.2 # 第 n 次重試前等 RETRY_BACKOFF * 2^n 秒
+
+_client: httpx.AsyncClient | None = None
+
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SECONDS
+        )
+    )
+
+# 在 app lifespan 啟動時建立，關閉時 close()
+async def start():
+    global _client
+    if _client is None:
+        _client = create_client()
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+# 沒經過 lifespan (例如指令碼直接呼叫) 就自己建一個
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+#region 統計
+# 最近幾次呼叫的耗時，跟各種結果的次數
+_latencies = deque(maxlen=1000)
+_counts = {"calls": 0, "success": 0, "failed": 0, "errors": 0, "retries": 0}
+
+def record(outcome: str, started: float):
+    _latencies.append(time.perf_counter() - started)
+    _counts["calls"] += 1
+    _counts[outcome] += 1
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+# 呼叫次數與耗時 (毫秒)；success=付款成功、failed=TapPay 回付款失敗、errors=連線或 HTTP 錯誤
+def stats() -> dict:
+    latencies = list(_latencies)
+    return {
+        **_counts,
+        "latency_ms": {
+            name: round(value * 1000, 1) if value is not None else None
+            for name, value in (("p50", percentile(latencies, 0.5)),
+                                ("p95", percentile(latencies, 0.95)),
+                                ("p99", percentile(latencies, 0.99)))
+        }
+    }
+#endregion
+
 # 串接 TapPay API
-async def post_tappay_api(prime, price, contact):
+# 有給 order_number 的話一起送給 TapPay，之後可以用 query_trade() 查這筆付款
+async def post_tappay_api(prime, price, contact, order_number=None):
     # 設定請求標頭
     headers = {
         "Content-Type": "application/json",
@@ -31,24 +108,73 @@ async def post_tappay_api(prime, price, contact):
         },
         "remember": True
     }
+    if order_number:
+        payload["order_number"] = order_number
 
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                TAPPAY_URL, 
-                json=payload, 
-                headers=headers, 
-                timeout=30.0
-            )
-            
-            # 檢查 HTTP 狀態碼
-            response.raise_for_status()
-            
-            return response.json()
-
-    except httpx.ConnectError:
-        return {"status": 1, "msg": "無法連線至 TapPay 伺服器"}
+        client = get_client()
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = await client.post(TAPPAY_URL, json=payload, headers=headers)
+                break
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= MAX_RETRIES:
+                    raise
+                _counts["retries"] += 1
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+        # 檢查 HTTP 狀態碼
+        response.raise_for_status()
+
+        result = response.json()
+        record("success" if result.get("status") == 0 else "failed", started)
+        return result
+
+    except (httpx.ConnectError, httpx.ConnectTimeout):
+        record("errors", started)
+        # 請求沒有送出去，付款 worker 可以放心重試
+        return {"status": 1, "msg": "無法連線至 TapPay 伺服器", "retryable": True}
+    except httpx.TimeoutException:
+        record("errors", started)
+        return {"status": 1, "msg": "TapPay 回應逾時"}
     except httpx.HTTPStatusError as e:
+        record("errors", started)
         return {"status": 1, "msg": f"TapPay API 回傳錯誤: {e.response.status_code}"}
     except Exception as e:
-        return {"status": 1, "msg": f"發生未知錯誤: {str(e)}"}
\ No newline at end of file
+        record("errors", started)
+        return {"status": 1, "msg": f"發生未知錯誤: {str(e)}"}
+
+# 用訂單編號查 TapPay 的交易紀錄
+# 回傳 {"paid": 有沒有扣款成功, "record": 扣款成功的那筆紀錄}；查詢失敗或交易還沒有結果 (無法判斷) 回傳 None
+PAID_RECORD_STATUS = (0, 1) # 0 已授權、1 已請款
+PENDING_RECORD_STATUS = 4 # 處理中
+async def query_trade(order_number: str) -> dict | None:
+    headers = {
+        "Content-Type": "application/json",
+        "x-api-key": PARTNER_KEY
+    }
+    payload = {
+        "partner_key": PARTNER_KEY,
+        "records_per_page": 50,
+        "page": 0,
+        "filters": {"order_number": order_number}
+    }
+    try:
+        response = await get_client().post(TAPPAY_RECORD_URL, json=payload, headers=headers)
+        response.raise_for_status()
+        result = response.json()
+    except Exception as e:
+        print(f"查詢 TapPay 交易紀錄失敗: {e}")
+        return None
+    # status 0 有資料、2 查無資料，其他都是查詢本身失敗
+    if result.get("status") not in (0, 2):
+        print(f"查詢 TapPay 交易紀錄失敗: {result.get('msg')}")
+        return None
+    records = [record for record in result.get("trade_records") or [] if record.get("order_number") == order_number]
+    for record in records:
+        if record.get("record_status") in PAID_RECORD_STATUS:
+            return {"paid": True, "record": record}
+    if any(record.get("record_status") == PENDING_RECORD_STATUS for record in records):
+        return None
+    return {"paid": False, "record": None}
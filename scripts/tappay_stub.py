@@ -0,0 +1,99 @@
+# 本機的假 TapPay，收到付款請求等一下就回結果，不會真的連到 TapPay
+# 開發、測試結帳流程、壓力測試都可以用，不需要網路跟 TapPay 帳號
+# 用法：uvicorn scripts.tappay_stub:app --port 8100
+#       再把 .env 的 TAPPAY_URL 設成 http://127.0.0.1:8100/tpc/payment/pay-by-prime
+#       TAPPAY_RECORD_URL 設成 http://127.0.0.1:8100/tpc/transaction/query (交易紀錄查詢)
+# 環境變數：
+#   TAPPAY_STUB_DELAY=0.2      模擬的回應時間 (秒)
+#   TAPPAY_STUB_JITTER=0.1     回應時間另外隨機加上 0 ~ JITTER 秒
+#   TAPPAY_STUB_FAIL_RATE=0    隨機回付款失敗的比例 (0 ~ 1)
+# 特定的 prime 會固定回某種結果，方便測試：
+#   test_fail     付款失敗 (卡片被拒)
+#   test_timeout  很久才回應 (測試逾時)
+#   test_error    HTTP 500
+import asyncio
+import os
+import random
+import secrets
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DELAY = float(os.getenv("TAPPAY_STUB_DELAY", "0.2"))
+JITTER = float(os.getenv("TAPPAY_STUB_JITTER", "0"))
+FAIL_RATE = float(os.getenv("TAPPAY_STUB_FAIL_RATE", "0"))
+
+app = FastAPI()
+
+# 收到的付款次數，給測試檢查用
+stats = {"requests": 0, "success": 0, "failed": 0}
+# 有帶 order_number 的付款紀錄，給交易紀錄查詢用：order_number -> [紀錄, ...]
+trade_records = {}
+
+def save_record(payload: dict, result: dict, record_status: int):
+    order_number = payload.get("order_number")
+    if order_number:
+        trade_records.setdefault(order_number, []).append({
+            "order_number": order_number,
+            "record_status": record_status,
+            "amount": payload.get("amount"),
+            "rec_trade_id": result.get("rec_trade_id"),
+            "bank_transaction_id": result.get("bank_transaction_id")
+        })
+
+def failure(payload: dict) -> dict:
+    return {
+        "status": 10003,
+        "msg": "Card Error",
+        "amount": payload.get("amount")
+    }
+
+@app.post("/tpc/payment/pay-by-prime")
+async def pay_by_prime(request: Request):
+    payload = await request.json()
+    stats["requests"] += 1
+    prime = payload.get("prime")
+
+    if prime == "test_timeout":
+        await asyncio.sleep(120)
+    await asyncio.sleep(DELAY + random.uniform(0, JITTER))
+
+    if prime == "test_error":
+        return JSONResponse(status_code=500, content={"status": 500, "msg": "Internal Error"})
+    # 跟 TapPay 一樣檢查必要欄位
+    if not payload.get("partner_key") or not payload.get("merchant_id") or not prime:
+        return {"status": 4, "msg": "Missing required field"}
+    if prime == "test_fail" or random.random() < FAIL_RATE:
+        stats["failed"] += 1
+        result = failure(payload)
+        save_record(payload, result, -1)
+        return result
+
+    stats["success"] += 1
+    result = {
+        "status": 0,
+        "msg": "Success",
+        "rec_trade_id": "D" + secrets.token_hex(8),
+        "bank_transaction_id": "TP" + secrets.token_hex(8),
+        "amount": payload.get("amount"),
+        "currency": "TWD"
+    }
+    save_record(payload, result, 0) # 0：已授權
+    return result
+
+# 交易紀錄查詢 (只支援用 order_number 查)，查無資料時 status 是 2
+@app.post("/tpc/transaction/query")
+async def query_records(request: Request):
+    payload = await request.json()
+    if not payload.get("partner_key"):
+        return {"status": 4, "msg": "Missing required field"}
+    records = trade_records.get((payload.get("filters") or {}).get("order_number"), [])
+    return {
+        "status": 0 if records else 2,
+        "msg": "Success" if records else "No data",
+        "number_of_transactions": len(records),
+        "trade_records": records
+    }
+
+@app.get("/stats")
+async def get_stats():
+    return stats
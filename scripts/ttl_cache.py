@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+# 有大小上限、會過期的記憶體快取 (LRU)
+# 滿了就丟掉最久沒用到的；每筆可以有自己的到期時間 (unix time)，過期就當作不存在
+# 同步的 API 在 threadpool 裡跑，所以全部操作都加鎖
+
+MISSING = object() # 快取裡沒有 (跟存了 None 區分開來)
+
+class TTLCache:
+    # max_size=None 表示不限筆數；ttl 是沒指定到期時間時的預設存活秒數 (None 表示不會過期)
+    def __init__(self, max_size: int | None = 1000, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict() # key -> (到期時間 or None, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # 取值，沒有或過期回傳 default
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key) # 最近用過的放到最後
+            self.hits += 1
+            return value
+
+    # 存值，expires_at (unix time) 跟 ttl (秒) 都沒給就用預設的 ttl
+    def set(self, key, value, expires_at: float | None = None, ttl: float | None = None):
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            if self.max_size is not None:
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False) # 丟掉最久沒用到的
+                    self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # 清掉已經過期的 (平常是讀到才刪，這個給需要主動整理的地方用)
+    def prune(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
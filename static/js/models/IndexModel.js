@@ -1,6 +1,7 @@
 export class IndexModel {
     constructor() {
         this.nextPage = 0;
+        this.nextCursor = null; // 上一頁最後一筆的位置，有的話就用 cursor 分頁
         this.isloading = false;
     }
 
@@ -15,7 +16,9 @@ export class IndexModel {
             // 如果是"全部分類"就直接輸入空字串
             const safeCategory = category === "全部分類" ? "" : category;
 
-            const url = `/api/attractions?page=${page}&category=${category}&keyword=${keyword}`;
+            // 第一頁用頁碼，之後用上一頁給的 cursor 接著往下抓
+            const position = this.nextCursor ? `after=${this.nextCursor}` : `page=${page}`;
+            const url = `/api/attractions?${position}&category=${category}&keyword=${keyword}`;
             const res = await fetch(url, { method: "GET" });
             
             if(!res.ok) {
@@ -25,6 +28,7 @@ export class IndexModel {
             const data = await res.json();
 
             this.nextPage = data.nextPage;
+            this.nextCursor = data.nextCursor ?? null;
 
             return data.data; // 回傳純陣列
         }
@@ -76,6 +80,7 @@ export class IndexModel {
     // 重製狀態
     resetState() {
         this.nextPage = 0;
+        this.nextCursor = null;
         this.isLoading = false;
     }
 }
\ No newline at end of file
@@ -0,0 +1,78 @@
+import pytest
+# module
+from scripts import sql_connector
+
+# 假的 mysql-connector：不用真的資料庫也能跑連線池、run_in_db
+# handler(sql, params) 回傳這句 SQL 的查詢結果 (list)，可以在裡面 sleep 模擬慢查詢
+class FakeCursor:
+    def __init__(self, handler):
+        self.handler = handler
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.rows = list(self.handler(sql, params) or [])
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.handler)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+# 把主資料庫的連線池換成連到假資料庫的新池子 (沒有副本)
+# 用法：pool = fake_db(handler, max_size=1)
+@pytest.fixture
+def fake_db(monkeypatch):
+    pools = []
+
+    def install(handler, max_size: int = sql_connector.POOL_MAX_SIZE, timeout: float = 5):
+        monkeypatch.setattr(sql_connector.mysql.connector, "connect", lambda **config: FakeConnection(handler))
+        pool = sql_connector.ConnectionPool(
+            sql_connector.DB_CONFIG,
+            min_size=0,
+            max_size=max_size,
+            timeout=timeout,
+            max_idle=sql_connector.POOL_MAX_IDLE,
+            max_lifetime=sql_connector.POOL_MAX_LIFETIME,
+            ping_after=sql_connector.POOL_PING_AFTER
+        )
+        monkeypatch.setattr(sql_connector, "connection_pool", pool)
+        monkeypatch.setattr(sql_connector, "replica_pools", [])
+        pools.append(pool)
+        return pool
+
+    yield install
+    for pool in pools:
+        pool.close_all()
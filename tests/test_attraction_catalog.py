@@ -0,0 +1,25 @@
+import datetime
+# module
+from scripts import attraction_catalog
+
+ROW = (1, "新北投溫泉區", "養生溫泉", "", "", "", "新北投", "25.137077", "121.508447", '["a.jpg"]')
+
+# 資料集版本跟景點在同一個 snapshot 裡讀 (先開 transaction，兩句都在裡面)
+def test_load_from_db_reads_in_one_snapshot(fake_db):
+    executed = []
+
+    def handler(sql, params):
+        executed.append(sql)
+        if sql == attraction_catalog.SQL_DATASET_VERSION:
+            return [(3, datetime.datetime(2030, 1, 1))]
+        if sql == attraction_catalog.SQL_LOAD:
+            return [ROW]
+        return []
+
+    pool = fake_db(handler, max_size=1)
+    snapshot = attraction_catalog.load_from_db()
+    assert executed == [attraction_catalog.SQL_START_SNAPSHOT, attraction_catalog.SQL_DATASET_VERSION, attraction_catalog.SQL_LOAD]
+    assert snapshot.dataset_version == 3
+    assert snapshot.version.startswith("3-")
+    assert len(snapshot) == 1
+    assert pool.stats()["in_use"] == 0
@@ -0,0 +1,43 @@
+import pytest
+# module
+from scripts import booking_cache
+from scripts.ttl_cache import MISSING
+
+@pytest.fixture(autouse=True)
+def memory_backend(monkeypatch):
+    monkeypatch.setattr(booking_cache, "backend", booking_cache.MemoryBackend())
+    monkeypatch.setattr(booking_cache, "BOOKING_CACHE_TTL", 30)
+
+def test_load_caches_until_invalidated():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"data": len(calls)}
+
+    assert booking_cache.load(1, loader) == {"data": 1}
+    assert booking_cache.load(1, loader) == {"data": 1}
+    booking_cache.invalidate(1)
+    assert booking_cache.load(1, loader) == {"data": 2}
+    assert len(calls) == 2
+
+# 查資料庫期間有寫入：查到的是寫入前的內容，不能存進快取
+def test_write_during_load_is_not_overwritten():
+    def stale_loader():
+        booking_cache.invalidate(1) # 別的 request 在這時候 commit 了新的預定
+        return {"data": "old"}
+
+    assert booking_cache.load(1, stale_loader) == {"data": "old"}
+    assert booking_cache.backend.get(1) is MISSING
+    assert booking_cache.load(1, lambda: {"data": "new"}) == {"data": "new"}
+    assert booking_cache.backend.get(1) == {"data": "new"}
+
+# 別人正在查的時候 (已經有占位)，自己查到的不存
+def test_only_lease_holder_fills():
+    def loader():
+        assert booking_cache.load(1, lambda: {"data": "second"}) == {"data": "second"}
+        assert booking_cache.backend.get(1) is MISSING
+        return {"data": "first"}
+
+    assert booking_cache.load(1, loader) == {"data": "first"}
+    assert booking_cache.backend.get(1) == {"data": "first"}
@@ -0,0 +1,68 @@
+import asyncio
+import time
+import httpx
+# module
+from app import app
+from api import order
+from scripts import auth, tappay
+
+BOOKING = {"id": 1, "price": 2000, "attraction_id": 1, "booking_date": "2030-01-01", "booking_time": "morning"}
+ORDER_REQUEST = {
+    "prime": "test_prime",
+    "order": {
+        "price": 2000,
+        "trip": {
+            "attraction": {"id": 1, "name": "", "address": "", "image": ""},
+            "date": "2030-01-01",
+            "time": "morning"
+        },
+        "contact": {"name": "test", "email": "test@example.com", "phone": "0912345678"}
+    }
+}
+
+def bookings_db(sql, params):
+    if sql == order.SQL_CURRENT_BOOKING:
+        return [dict(BOOKING)]
+    return []
+
+# 只有一條連線的連線池，付款 (TapPay) 還沒回來時，其他請求照樣借得到這條連線
+def test_pool_available_while_paying(fake_db, monkeypatch):
+    pool = fake_db(bookings_db, max_size=1, timeout=1)
+    paying = asyncio.Event()
+    finish_payment = asyncio.Event()
+
+    async def slow_tappay(prime, price, contact, order_number=None):
+        paying.set()
+        await finish_payment.wait()
+        return {"status": 0, "msg": "Success"}
+
+    monkeypatch.setattr(tappay, "post_tappay_api", slow_tappay)
+    monkeypatch.setattr(order, "CHECKOUT_MODE", "sync")
+    app.dependency_overrides[auth.require_user] = lambda: {"id": 1, "name": "test", "email": "test@example.com"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            checkout = asyncio.create_task(client.post("/api/orders", json=ORDER_REQUEST))
+            await asyncio.wait_for(paying.wait(), 5)
+
+            # 付款進行中：唯一的連線已經還回池子，不用等就借得到
+            assert pool.stats()["in_use"] == 0
+            started = time.perf_counter()
+            conn = pool.acquire(timeout=0.1)
+            pool.release(conn)
+            waited = time.perf_counter() - started
+
+            finish_payment.set()
+            response = await checkout
+            return response, waited
+
+    try:
+        response, waited = asyncio.run(run())
+    finally:
+        app.dependency_overrides.clear()
+
+    assert waited < 0.05
+    assert response.status_code == 200
+    assert response.json()["data"]["payment"] == {"status": 0, "message": "付款成功"}
+    assert pool.stats()["in_use"] == 0
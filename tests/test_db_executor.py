@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+# module
+from scripts import sql_connector
+
+QUERY_SECONDS = 0.3
+
+def slow_query(sql, params):
+    time.sleep(QUERY_SECONDS) # 模擬慢查詢，會卡住執行的 thread
+    return [(1, )]
+
+# 同時送出的查詢在 db_executor 裡一起跑，總耗時約等於一次查詢，不是一個接一個
+def test_concurrent_queries_overlap(fake_db):
+    fake_db(slow_query)
+    concurrency = 5
+
+    async def run():
+        started = time.perf_counter()
+        results = await asyncio.gather(*[sql_connector.fetch_all_async("SELECT 1;") for _ in range(concurrency)])
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    assert results == [[(1, )]] * concurrency
+    assert elapsed < QUERY_SECONDS * 2
+    assert elapsed >= QUERY_SECONDS
+
+# 查詢進行中 event loop 沒有被卡住，其他 coroutine 照常執行
+def test_event_loop_not_blocked(fake_db):
+    fake_db(slow_query)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await sql_connector.fetch_one_async("SELECT 1;")
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(run()) >= 10
+
+# 關掉壞掉的連線很慢時，其他人借連線不用等它關完
+def test_slow_close_does_not_block_acquire(fake_db, monkeypatch):
+    pool = fake_db(slow_query, max_size=2)
+    closing = threading.Event()
+
+    def slow_close(self):
+        closing.set()
+        time.sleep(QUERY_SECONDS)
+
+    broken = pool.acquire()
+    healthy = pool.acquire()
+    FakeConnection = type(broken)
+    pool.release(healthy)
+    monkeypatch.setattr(FakeConnection, "is_connected", lambda self: False)
+    monkeypatch.setattr(FakeConnection, "close", slow_close)
+    releaser = threading.Thread(target=pool.release, args=(broken, ))
+    releaser.start()
+    assert closing.wait(1)
+    started = time.perf_counter()
+    conn = pool.acquire(timeout=1)
+    assert time.perf_counter() - started < QUERY_SECONDS / 2
+    monkeypatch.setattr(FakeConnection, "close", lambda self: None)
+    pool.release(conn)
+    releaser.join()
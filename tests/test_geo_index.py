@@ -0,0 +1,31 @@
+import random
+import time
+# module
+from scripts.geo_index import GeoIndex, haversine
+
+random.seed(0)
+ATTRACTIONS = [
+    {"id": i, "lat": random.uniform(24.95, 25.2), "lng": random.uniform(121.4, 121.7)}
+    for i in range(1, 301)
+]
+
+def brute_force(lat, lng, radius, limit):
+    found = sorted((haversine(lat, lng, a["lat"], a["lng"]), a["id"]) for a in ATTRACTIONS)
+    return [item for item in found if item[0] <= radius][:limit]
+
+def test_nearby_matches_brute_force():
+    index = GeoIndex(ATTRACTIONS)
+    for _ in range(300):
+        lat, lng = random.uniform(24.9, 25.25), random.uniform(121.35, 121.75)
+        radius, limit = random.choice([200, 1000, 5000, 50000]), random.randint(1, 20)
+        assert index.nearby(lat, lng, radius, limit) == brute_force(lat, lng, radius, limit)
+
+# 高緯度時經度方向一格很短，圈數不能跟著暴增
+def test_far_away_query_returns_quickly():
+    index = GeoIndex(ATTRACTIONS)
+    started = time.perf_counter()
+    for lat, lng in [(89, 121.5), (90, 121.5), (-90, -180), (25, -170)]:
+        assert index.nearby(lat, lng, 50000, 8) == []
+    assert time.perf_counter() - started < 0.1
+    assert not index.covers_lat(90, 50000)
+    assert index.covers_lat(25.04, 2000)
@@ -0,0 +1,42 @@
+import asyncio
+import httpx
+import pytest
+# module
+from app import app
+from api import booking
+from scripts import attraction_catalog, auth, idempotency
+
+USER = {"id": 1, "name": "test", "email": "test@example.com"}
+ATTRACTION = {
+    "id": 1, "name": "新北投溫泉區", "category": "養生溫泉", "description": "", "address": "", "transport": "",
+    "mrt": "新北投", "lat": 25.137077, "lng": 121.508447, "images": ["a.jpg"]
+}
+BOOKING_REQUEST = {"attractionId": 1, "date": "2030-01-01", "time": "morning", "price": 2000}
+
+@pytest.fixture
+def booking_app(monkeypatch):
+    written = []
+    monkeypatch.setattr(idempotency, "store", idempotency.MemoryStore())
+    monkeypatch.setattr(auth, "get_user_data", lambda token: USER if token == "test_token" else None)
+    monkeypatch.setattr(attraction_catalog, "_snapshot", attraction_catalog.build_snapshot([ATTRACTION]))
+    monkeypatch.setattr(booking, "replace_booking", lambda member_id, data: written.append(data))
+    app.dependency_overrides[auth.require_user] = lambda: USER
+    yield written
+    app.dependency_overrides.clear()
+
+# 前端送到 /api/booking 會先 307 轉址到 /api/booking/：轉址不存，轉址後帶同一個 key 的請求照常執行
+def test_redirect_keeps_same_key(booking_app):
+    headers = {"Authorization": "Bearer test_token", "Idempotency-Key": "booking-1"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", follow_redirects=True) as client:
+            first = await client.post("/api/booking", json=BOOKING_REQUEST, headers=headers)
+            again = await client.post("/api/booking", json=BOOKING_REQUEST, headers=headers)
+            return first, again
+
+    first, again = asyncio.run(run())
+    assert [r.status_code for r in first.history] == [307]
+    assert first.status_code == 200 and first.json() == {"ok": True}
+    assert again.status_code == 200 and again.headers["idempotent-replayed"] == "true"
+    assert len(booking_app) == 1
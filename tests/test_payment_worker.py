@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+# module
+from scripts import payment_worker, tappay, tappay_stub
+
+JOB = {
+    "id": 7, "order_number": "20300101000000abcdef", "attempts": 1, "prime": "test_prime", "price": 2000,
+    "member_id": 1, "contact_name": "test", "contact_email": "test@example.com", "contact_phone": "0912345678"
+}
+
+# 假的 payment_jobs：第一次領取拿到一筆 job_status 的工作，之後都沒有；記下執行過的 SQL
+def jobs_db(job_status: str):
+    executed = []
+    claimed = False
+
+    def handler(sql, params):
+        nonlocal claimed
+        executed.append(sql)
+        if sql == payment_worker.SQL_CLAIM:
+            if claimed:
+                return []
+            claimed = True
+            return [{"id": JOB["id"], "status": job_status}]
+        if "FROM payment_jobs j" in sql:
+            return [dict(JOB)]
+        return []
+
+    return handler, executed
+
+@pytest.fixture(autouse=True)
+def reset_wake(monkeypatch):
+    monkeypatch.setattr(payment_worker, "_wake", None)
+
+# 停止 worker 時，處理中的付款會做完並寫回結果，不會被取消
+def test_shutdown_drains_in_flight_payment(fake_db, monkeypatch):
+    handler, executed = jobs_db("PENDING")
+    fake_db(handler)
+    paying = asyncio.Event()
+
+    async def slow_tappay(prime, price, contact, order_number=None):
+        paying.set()
+        await asyncio.sleep(0.2)
+        return {"status": 0, "msg": "Success"}
+
+    monkeypatch.setattr(tappay, "post_tappay_api", slow_tappay)
+
+    async def run():
+        worker = asyncio.create_task(payment_worker.run(poll_seconds=0.05))
+        await asyncio.wait_for(paying.wait(), 5)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(run())
+    assert payment_worker.SQL_ORDER_PAID in executed
+
+# 上次處理到一半的工作不再付款，照 TapPay 交易紀錄寫回結果
+@pytest.mark.parametrize("trade, expected_sql", [
+    ({"paid": True, "record": {"rec_trade_id": "D1", "record_status": 0}}, payment_worker.SQL_ORDER_PAID),
+    ({"paid": False, "record": None}, payment_worker.SQL_ORDER_PAYMENT_FAILED),
+    (None, payment_worker.SQL_JOB_RECONCILE)
+])
+def test_reclaimed_job_checks_trade_record(fake_db, monkeypatch, trade, expected_sql):
+    handler, executed = jobs_db("RUNNING")
+    fake_db(handler)
+
+    async def pay_again(*args, **kwargs):
+        raise AssertionError("重新領取的工作不應該再付款")
+
+    async def query_trade(order_number):
+        assert order_number == JOB["order_number"]
+        return trade
+
+    monkeypatch.setattr(tappay, "post_tappay_api", pay_again)
+    monkeypatch.setattr(tappay, "query_trade", query_trade)
+
+    async def run():
+        jobs = await asyncio.to_thread(payment_worker.claim_jobs, 1)
+        assert jobs[0]["reclaimed"]
+        await payment_worker.process_job(jobs[0])
+
+    asyncio.run(run())
+    assert expected_sql in executed
+
+# 用假 TapPay 查交易紀錄：付款時帶的 order_number 查得到，沒付過的查不到
+def test_query_trade_with_stub(monkeypatch):
+    monkeypatch.setattr(tappay, "PARTNER_KEY", "stub_partner_key")
+    monkeypatch.setattr(tappay, "MERCHANT_ID", "stub_merchant")
+    monkeypatch.setattr(tappay_stub, "DELAY", 0)
+    monkeypatch.setattr(tappay_stub, "trade_records", {})
+    contact = type("Contact", (), {"name": "test", "email": "test@example.com", "phone": "0912345678"})
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=tappay_stub.app), base_url="http://stub")
+        monkeypatch.setattr(tappay, "_client", client)
+        try:
+            paid = await tappay.post_tappay_api("test_prime", 2000, contact, order_number="A1")
+            failed = await tappay.post_tappay_api("test_fail", 2000, contact, order_number="A2")
+            return paid, failed, [await tappay.query_trade(number) for number in ("A1", "A2", "A3")]
+        finally:
+            await client.aclose()
+
+    paid, failed, trades = asyncio.run(run())
+    assert paid["status"] == 0 and failed["status"] != 0
+    assert trades[0]["paid"] and trades[0]["record"]["rec_trade_id"] == paid["rec_trade_id"]
+    assert trades[1] == {"paid": False, "record": None}
+    assert trades[2] == {"paid": False, "record": None}
+
+# 領取工作到一半就停止：已經領到 (commit 成 RUNNING) 的工作還是會付款寫回結果，不會卡住
+def test_shutdown_during_claim_processes_claimed_jobs(fake_db, monkeypatch):
+    handler, executed = jobs_db("PENDING")
+    claiming = threading.Event()
+
+    def slow_claim(sql, params):
+        if sql == payment_worker.SQL_CLAIM:
+            claiming.set()
+            time.sleep(0.2)
+        return handler(sql, params)
+
+    fake_db(slow_claim)
+
+    async def pay(prime, price, contact, order_number=None):
+        return {"status": 0, "msg": "Success"}
+
+    monkeypatch.setattr(tappay, "post_tappay_api", pay)
+
+    async def run():
+        worker = asyncio.create_task(payment_worker.run(poll_seconds=0.05))
+        assert await asyncio.to_thread(claiming.wait, 5)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(run())
+    assert payment_worker.SQL_ORDER_PAID in executed